@@ -1,3 +1,4 @@
 from .wrapper import TRTH
 from .dataframe import TRTHIterator
+from .retry import RetryPolicy
 from . import utils
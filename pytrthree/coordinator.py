@@ -0,0 +1,318 @@
+"""
+Lease-based work queue for ingesting a shared directory of TRTH parts from several hosts.
+
+Parts are registered as work units keyed by `(request ID, part)` (see `utils.parse_rid_type`)
+in a SQLite database living on the shared mount. Workers lease one unit at a time and keep
+the lease alive with heartbeats; units whose lease expires (e.g. because the worker crashed)
+are handed out again. Lease expiry uses wall-clock time, so host clocks must be in sync
+(e.g. NTP) and `lease_time` should be much larger than any expected clock skew.
+
+SQLite's WAL mode does not work over network file systems, so the database uses the
+default rollback journal and every state change is a short `BEGIN IMMEDIATE` transaction.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+import pandas as pd
+
+from . import utils
+from .gzindex import RICIndex
+
+logger = logging.getLogger('pytrthree')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS units (
+    rid TEXT NOT NULL,
+    part TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER,
+    seconds REAL,
+    error TEXT,
+    PRIMARY KEY (rid, part)
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (state, lease_expires);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started REAL,
+    last_heartbeat REAL
+);
+'''
+
+
+class WorkUnit(NamedTuple):
+    rid: str
+    part: str
+    path: str
+    size: int
+    attempts: int
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of TRTH parts shared by ingestion workers on several hosts.
+    Unit states: `pending`, `leased`, `done` and `failed` (after `max_attempts` failures).
+    """
+
+    def __init__(self, path, lease_time=300, max_attempts=3):
+        """
+        :param path: SQLite database path (on the shared mount)
+        :param lease_time: Seconds a lease stays valid without heartbeats
+        :param max_attempts: Number of leases of a unit before it is marked as failed
+        """
+        self.path = os.path.expanduser(path)
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Yields a connection inside an immediate (write-locking) transaction"""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _make_unit(path):
+        fname = os.path.basename(path)
+        rid, part = utils.parse_rid_type(fname)
+        if part in {'confirmation', 'report'} or fname.endswith(RICIndex.SUFFIX):
+            return None
+        return rid, part or 'part000', os.path.abspath(path), os.path.getsize(path)
+
+    def add(self, files: Iterable[str]) -> int:
+        """
+        Registers parts as pending work units. Already registered units are left untouched,
+        so every worker can safely call this with the same file list.
+        :param files: Paths of TRTH parts. Confirmation/report and unparseable files are ignored.
+        :return: Number of new units
+        """
+        units = []
+        for path in files:
+            try:
+                unit = self._make_unit(path)
+            except (IndexError, ValueError):
+                unit = None
+            if unit is None:
+                logger.debug(f'Ignoring {path}')
+            else:
+                units.append(unit)
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO units (rid, part, path, size) VALUES (?, ?, ?, ?)', units)
+            return conn.total_changes - before
+
+    def register(self, worker: str):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?, ?)',
+                         (worker, socket.gethostname(), os.getpid(), now, now))
+
+    def acquire(self, worker: str) -> Optional[WorkUnit]:
+        """
+        Leases the next pending (or expired) unit to `worker`.
+        Expired units which have already been leased `max_attempts` times (e.g. parts crashing
+        their workers) are marked as failed instead.
+        :return: Leased unit, or None if there is no unit available
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE units SET state = 'failed', lease_expires = NULL, "
+                                  "error = 'Lease expired after ' || attempts || ' attempts' "
+                                  "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                                  (now, self.max_attempts))
+            if cursor.rowcount:
+                logger.error(f'{cursor.rowcount} unit(s) failed: lease expired {self.max_attempts} times')
+            row = conn.execute("SELECT rid, part, path, size, attempts, state, worker FROM units "
+                               "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                               "ORDER BY state = 'leased', rid, part LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            rid, part, path, size, attempts, state, previous = row
+            if state == 'leased':
+                logger.warning(f'Lease of {rid}-{part} by {previous} expired: reassigning to {worker}')
+            conn.execute("UPDATE units SET state = 'leased', worker = ?, lease_expires = ?, "
+                         "attempts = attempts + 1 WHERE rid = ? AND part = ?",
+                         (worker, now + self.lease_time, rid, part))
+            conn.execute('UPDATE workers SET last_heartbeat = ? WHERE name = ?', (now, worker))
+        return WorkUnit(rid, part, path, size, attempts + 1)
+
+    def heartbeat(self, worker: str, unit: Optional[WorkUnit] = None) -> bool:
+        """
+        Extends the lease of `unit` (if given) and records that `worker` is alive.
+        :return: False if the lease of `unit` has been lost (i.e. it was reassigned)
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('UPDATE workers SET last_heartbeat = ? WHERE name = ?', (now, worker))
+            if unit is None:
+                return True
+            cursor = conn.execute("UPDATE units SET lease_expires = ? WHERE rid = ? AND part = ? "
+                                  "AND worker = ? AND state = 'leased'",
+                                  (now + self.lease_time, unit.rid, unit.part, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, worker: str, unit: WorkUnit, rows: int, seconds: float) -> bool:
+        """
+        Marks a leased unit as done.
+        :return: False if the lease had been lost, in which case the unit is left to its new owner
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE units SET state = 'done', lease_expires = NULL, rows = ?, "
+                                  "seconds = ?, error = NULL WHERE rid = ? AND part = ? AND worker = ? "
+                                  "AND state = 'leased'",
+                                  (rows, seconds, unit.rid, unit.part, worker))
+        if cursor.rowcount != 1:
+            logger.warning(f'{worker} lost the lease of {unit.rid}-{unit.part} before completing it')
+        return cursor.rowcount == 1
+
+    def fail(self, worker: str, unit: WorkUnit, error: str):
+        """Releases a leased unit after an error, marking it as failed after `max_attempts`"""
+        state = 'failed' if unit.attempts >= self.max_attempts else 'pending'
+        with self.transaction() as conn:
+            conn.execute("UPDATE units SET state = ?, lease_expires = NULL, error = ? "
+                         "WHERE rid = ? AND part = ? AND worker = ? AND state = 'leased'",
+                         (state, error, unit.rid, unit.part, worker))
+
+    def reset(self, states=('failed',)):
+        """Makes units in `states` pending again"""
+        with self.transaction() as conn:
+            conn.execute(f"UPDATE units SET state = 'pending', worker = NULL, lease_expires = NULL, "
+                         f"attempts = 0 WHERE state IN ({','.join('?' * len(states))})", tuple(states))
+
+    def units(self) -> pd.DataFrame:
+        """Returns all work units"""
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            return pd.read_sql('SELECT * FROM units ORDER BY rid, part', conn)
+        finally:
+            conn.close()
+
+    def stats(self) -> pd.DataFrame:
+        """
+        Returns per-worker throughput: completed units, rows, bytes, busy seconds,
+        rows/sec, MiB/sec, currently leased units and whether the worker is alive
+        (i.e. sent a heartbeat within `lease_time`).
+        """
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            df = pd.read_sql("SELECT w.name AS worker, w.host, w.pid, w.last_heartbeat, "
+                             "SUM(u.state = 'done') AS units, SUM(u.state = 'leased') AS leased, "
+                             "SUM(CASE WHEN u.state = 'done' THEN u.rows END) AS rows, "
+                             "SUM(CASE WHEN u.state = 'done' THEN u.size END) AS bytes, "
+                             "SUM(CASE WHEN u.state = 'done' THEN u.seconds END) AS seconds "
+                             "FROM workers w LEFT JOIN units u ON u.worker = w.name "
+                             "GROUP BY w.name ORDER BY w.name", conn)
+        finally:
+            conn.close()
+        df[['units', 'leased', 'rows', 'bytes', 'seconds']] = \
+            df[['units', 'leased', 'rows', 'bytes', 'seconds']].fillna(0)
+        seconds = df['seconds'].where(df['seconds'] > 0)
+        df['rows_per_sec'] = df['rows'] / seconds
+        df['mib_per_sec'] = df['bytes'] / 2 ** 20 / seconds
+        df['alive'] = time.time() - df['last_heartbeat'] < self.lease_time
+        df['last_heartbeat'] = pd.to_datetime(df['last_heartbeat'], unit='s')
+        return df.set_index('worker')
+
+    def progress(self) -> dict:
+        """Returns the number of units in each state"""
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            return dict(conn.execute('SELECT state, COUNT(*) FROM units GROUP BY state').fetchall())
+        finally:
+            conn.close()
+
+
+class Worker:
+    """
+    Processes units of a `WorkQueue` until none is left,
+    sending heartbeats from a background thread while a unit is being processed.
+    """
+
+    def __init__(self, queue: WorkQueue, name: Optional[str] = None, heartbeat: Optional[float] = None):
+        """
+        :param queue: Shared work queue
+        :param name: Unique worker name. Defaults to `<hostname>-<pid>`.
+        :param heartbeat: Seconds between heartbeats. Defaults to a third of the lease time.
+        """
+        self.queue = queue
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.heartbeat = heartbeat or queue.lease_time / 3
+        self.current = None
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+        self.queue.register(self.name)
+
+    def _beat(self):
+        while not self.stopped.wait(self.heartbeat):
+            unit = self.current
+            try:
+                if not self.queue.heartbeat(self.name, unit) and unit is self.current:
+                    self.lost.set()
+            except sqlite3.Error as e:
+                logger.warning(f'Heartbeat of {self.name} failed: {e}')
+
+    def run(self, process: Callable[[WorkUnit, threading.Event], int], max_units=None,
+            exceptions=(Exception,)) -> List[WorkUnit]:
+        """
+        :param process: Function ingesting a unit and returning the number of rows processed.
+                        Also receives an event which is set if the lease of the unit is lost
+                        (i.e. it was reassigned), in which case it should stop as soon as possible.
+        :param max_units: Maximum number of units to process
+        :param exceptions: Exceptions that fail the current unit instead of stopping the worker
+        :return: Completed units
+        """
+        completed = []
+        self.stopped.clear()
+        thread = threading.Thread(target=self._beat, name=f'{self.name}-heartbeat', daemon=True)
+        thread.start()
+        try:
+            while max_units is None or len(completed) < max_units:
+                unit = self.queue.acquire(self.name)
+                if unit is None:
+                    break
+                self.current = unit
+                self.lost.clear()
+                logger.info(f'{self.name}: processing {unit.rid}-{unit.part} (attempt #{unit.attempts})')
+                start = time.monotonic()
+                try:
+                    rows = process(unit, self.lost)
+                except exceptions as e:
+                    logger.exception(f'{self.name}: {unit.rid}-{unit.part} failed')
+                    self.queue.fail(self.name, unit, repr(e))
+                    continue
+                finally:
+                    self.current = None
+                if self.lost.is_set():
+                    logger.warning(f'{self.name}: lease of {unit.rid}-{unit.part} was lost during processing, '
+                                   f'leaving it to its new owner')
+                elif self.queue.complete(self.name, unit, rows, time.monotonic() - start):
+                    completed.append(unit)
+        finally:
+            self.stopped.set()
+            thread.join()
+        return completed
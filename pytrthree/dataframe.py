@@ -1,4 +1,5 @@
 import io
+import os
 import re
 from typing import Sequence, Union
 
@@ -7,6 +8,8 @@ import pandas as pd
 import pytz
 
 from . import utils
+from .gzindex import RICIndex
+from .transcode import ZstdPart, source_path
 
 logger = utils.make_logger('pytrthree')
 
@@ -19,15 +22,24 @@ class TRTHIterator:
     and yield DataFrame grouped by RIC.
     """
 
-    def __init__(self, files, chunksize=10 ** 6):
+    def __init__(self, files, chunksize=10 ** 6, rics=None, build_index=False, transcoded=True):
         """
         Validates input files and initializes iterator.
         :param files: Compressed CSV files downloaded from the TRTH API
         :param chunksize: Number of rows to be parsed per iteration.
                           Higher number causes higher memory usage.
+        :param rics: Only parse these RICs. Files with a sidecar `RICIndex` are
+                     read by seeking to the requested RICs instead of being fully scanned.
+        :param build_index: Whether to build missing/stale sidecar indexes when `rics` is given
+        :param transcoded: Whether to read up-to-date transcoded `.csv.zst` versions of `.csv.gz` parts
+                           instead of the parts themselves (requires `zstandard`). Row counts of
+                           transcoded parts are verified against their source.
         """
         self.files = self._validate_input(files)
         self.chunksize = chunksize
+        self.rics = set(rics) if rics is not None else None
+        self.build_index = build_index
+        self.transcoded = transcoded
         self.iter = self.make_next()
 
     def __iter__(self):
@@ -36,6 +48,14 @@ class TRTHIterator:
     def __next__(self):
         return next(self.iter)
 
+    def bars(self, freq='1min', by='time', **kwargs) -> 'BarAggregator':
+        """
+        Returns an iterator of `(ric, bars)` aggregated on the fly. See `BarAggregator`.
+        :param freq: Pandas frequency string (time bars) or bar size (volume/tick bars)
+        :param by: Bar type: 'time', 'volume' or 'tick'
+        """
+        return BarAggregator(self, freq=freq, by=by, **kwargs)
+
     @staticmethod
     def _validate_input(files: Union[TRTHFile, Sequence[TRTHFile]]) -> Sequence[TRTHFile]:
         if isinstance(files, (str, io.TextIOWrapper)):
@@ -47,6 +67,9 @@ class TRTHIterator:
         output = []
         for file in files:
             fname = file.name if isinstance(file, io.TextIOWrapper) else file
+            if fname.endswith((RICIndex.SUFFIX, '.tmp')):
+                logger.debug(f'Ignoring {fname}')
+                continue
             try:
                 _, ftype = utils.parse_rid_type(fname)
             except (IndexError, ValueError):
@@ -58,21 +81,58 @@ class TRTHIterator:
             else:
                 output.append(file)
 
+        # Transcoded parts are read instead of their source when possible (see `_read_chunks`)
+        sources = {f for f in output if isinstance(f, str) and f.endswith('.gz')}
+        output = [f for f in output if not (isinstance(f, str) and f.endswith('.zst') and source_path(f) in sources)]
         return sorted(output)
 
+    def _read_transcoded(self, part: ZstdPart):
+        """
+        Generates CSV chunks of a transcoded part. The row counts of the index are checked against
+        the source before reading, and each frame is checked against the index as it is decompressed.
+        """
+        if part.rows != part.source.get('rows', part.rows):
+            raise ValueError(f'{part.path}: index has {part.rows} rows, source {part.source["rows"]}')
+        with part.open(self.rics) as f:
+            yield from pd.read_csv(f, iterator=True, chunksize=self.chunksize)
+
+    def _read_chunks(self, file):
+        """
+        Generates CSV chunks from the fastest available representation of `file`:
+        its transcoded version, its RIC index (if `self.rics` is given) or the file itself.
+        """
+        if isinstance(file, str) and (self.transcoded or file.endswith('.zst')):
+            part = ZstdPart.get(file)
+            if part is not None:
+                yield from self._read_transcoded(part)
+                return
+            if file.endswith('.zst') and os.path.exists(source_path(file)):
+                file = source_path(file)
+        if self.rics is not None and isinstance(file, str):
+            index = RICIndex.get(file, build=self.build_index)
+            if index is not None:
+                with index.open(self.rics) as f:
+                    yield from pd.read_csv(f, iterator=True, chunksize=self.chunksize)
+                return
+        yield from pd.read_csv(file, iterator=True, chunksize=self.chunksize)
+
     def make_next(self):
         """Iterates over input files and generates single-RIC DataFrames"""
         for file in self.files:
             lastrow = None
-            chunks = pd.read_csv(file, iterator=True, chunksize=self.chunksize)
-            for i, chunk in enumerate(chunks):
-                fname = file.name if isinstance(file, io.TextIOWrapper) else file
-                logger.info('{} chunk #{}'.format(fname.split('/')[-1], i+1))
-                for ric, df in chunk.groupby('#RIC'):
-                    processed_df = self.pre_process(df.copy(), lastrow)
-                    yield (ric, processed_df)
-                    lastrow = None
-                lastrow = processed_df.iloc[-1]
+            fname = file.name if isinstance(file, io.TextIOWrapper) else file
+            with utils.Progress(logger, fname.split('/')[-1]) as progress:
+                for chunk in self._read_chunks(file):
+                    progress.update(rows=len(chunk))
+                    if self.rics is not None:
+                        chunk = chunk[chunk['#RIC'].isin(self.rics)]
+                        if chunk.empty:
+                            continue
+                    for ric, df in chunk.groupby('#RIC'):
+                        processed_df = self.pre_process(df.copy(), lastrow)
+                        yield (ric, processed_df)
+                        lastrow = None
+                    lastrow = processed_df.iloc[-1]
 
     @staticmethod
     def pre_process(df, lastrow=None) -> pd.DataFrame:
@@ -106,7 +166,7 @@ class TRTHIterator:
         # Make DateTimeIndex timezone-aware
         if gmt_col:
             assert len(df[gmt_col].value_counts()) == 1
-            df.index = df.index + pd.Timedelta(hours=df.ix[0, gmt_col])
+            df.index = df.index + pd.Timedelta(hours=df[gmt_col].iloc[0])
             df.index = df.index.tz_localize(pytz.FixedOffset(9 * 60))
             df.drop(gmt_col, axis=1, inplace=True)
         else:
@@ -114,8 +174,130 @@ class TRTHIterator:
 
         # Make sure rows separated by chunks have different timestamps
         if lastrow is not None:
-            if lastrow['RIC'] == df.ix[0, 'RIC'] and lastrow.name == df.index[0]:
-                logger.debug(f'Adjusting first row timestamp: {df.ix[0, "RIC"]}')
-                df.index.values[0] += np.timedelta64(1, 'us')
+            if lastrow['RIC'] == df['RIC'].iloc[0] and lastrow.name == df.index[0]:
+                logger.debug(f'Adjusting first row timestamp: {df["RIC"].iloc[0]}')
+                offset = np.zeros(len(df), dtype='timedelta64[us]')
+                offset[0] = np.timedelta64(1, 'us')
+                df.index += offset
 
         return df
+
+
+class BarAggregator:
+    """
+    Streaming OHLCV/VWAP bar builder for `TRTHIterator` output.
+    Bars are built chunk by chunk and the last (partial) bar of each RIC is carried over
+    chunk/file boundaries, so raw ticks never need to be fully materialized.
+    Yields `(ric, bars)` tuples, where `bars` has the columns
+    `open, high, low, close, volume, vwap, ticks`.
+    """
+
+    COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'vwap', 'ticks']
+
+    def __init__(self, iterator, freq='1min', by='time', price='Price', volume='Volume', types=('Trade',)):
+        """
+        :param iterator: Iterable of `(ric, df)` tuples, such as a `TRTHIterator`
+        :param freq: Pandas frequency string (`by='time'`) or bar size in shares (`by='volume'`)
+                     or number of ticks (`by='tick'`)
+        :param by: Bar type: 'time', 'volume' or 'tick'
+        :param price: Price column name
+        :param volume: Volume column name
+        :param types: Values of the `Type` column to be aggregated (if present).
+                      None means all rows are used.
+        """
+        if by not in {'time', 'volume', 'tick'}:
+            raise ValueError(f'Invalid bar type: {by}')
+        if by != 'time' and not (isinstance(freq, (int, float)) and freq > 0):
+            raise ValueError(f'Invalid {by} bar size: {freq}')
+        self.iterator = iterator
+        self.freq = freq
+        self.by = by
+        self.price = price
+        self.volume = volume
+        self.types = types
+        self.partial = {}
+        self.totals = {}
+        self.iter = self.make_next()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.iter)
+
+    def make_next(self):
+        for ric, df in self.iterator:
+            bars = self.aggregate(ric, df)
+            if bars is not None and len(bars):
+                yield ric, self._finalize(bars)
+        for ric in list(self.partial):
+            self.totals.pop(ric, None)
+            yield ric, self._finalize(self.partial.pop(ric).to_frame().T)
+
+    def _keys(self, ric, index, volume):
+        """
+        Returns the bar key of each row: bar start for time bars, or
+        `cumulative size before row // freq` for volume/tick bars.
+        """
+        if self.by == 'time':
+            return index.floor(self.freq)
+        size = np.ones(len(index)) if self.by == 'tick' else volume.values
+        cumsum = np.cumsum(size)
+        base = self.totals.get(ric, 0)
+        self.totals[ric] = base + cumsum[-1]
+        before = base + np.concatenate([[0], cumsum[:-1]])
+        return pd.Index((before // self.freq).astype(np.int64))
+
+    def aggregate(self, ric, df) -> pd.DataFrame:
+        """
+        Aggregates a single-RIC DataFrame into bars.
+        :return: Completed bars (including aggregation columns). The last bar is kept in `self.partial`.
+        """
+        if self.types is not None and 'Type' in df.columns:
+            df = df[df['Type'].isin(self.types)]
+        df = df[df[self.price].notnull()] if self.price in df.columns else df.iloc[:0]
+        if df.empty:
+            return None
+
+        price = df[self.price].astype(float)
+        if self.volume in df.columns:
+            volume = df[self.volume].fillna(0).astype(float)
+        else:
+            volume = pd.Series(0.0, index=df.index)
+        partial = self.partial.get(ric)
+        keys = self._keys(ric, df.index, volume)
+        data = pd.DataFrame({'price': price.values, 'volume': volume.values,
+                             'turnover': (price * volume).values, 'time': df.index}, index=keys)
+        grouped = data.groupby(level=0, sort=False)
+        bars = pd.DataFrame({'open': grouped['price'].first(),
+                             'high': grouped['price'].max(),
+                             'low': grouped['price'].min(),
+                             'close': grouped['price'].last(),
+                             'volume': grouped['volume'].sum(),
+                             'turnover': grouped['turnover'].sum(),
+                             'ticks': grouped['price'].size(),
+                             'time': grouped['time'].first()})
+
+        if partial is not None:
+            if bars.index[0] == partial.name:
+                first = bars.iloc[0]
+                bars.iloc[0] = [partial['open'], max(partial['high'], first['high']),
+                                min(partial['low'], first['low']), first['close'],
+                                partial['volume'] + first['volume'],
+                                partial['turnover'] + first['turnover'],
+                                partial['ticks'] + first['ticks'], partial['time']]
+            else:
+                bars = pd.concat([partial.to_frame().T, bars])
+
+        self.partial[ric] = bars.iloc[-1].copy()
+        return bars.iloc[:-1]
+
+    def _finalize(self, bars) -> pd.DataFrame:
+        bars = bars.copy()
+        if self.by != 'time':
+            bars.index = pd.DatetimeIndex(bars['time'])
+        bars.index.name = None
+        volume = bars['volume'].astype(float)
+        bars['vwap'] = (bars['turnover'].astype(float) / volume.where(volume > 0)).values
+        bars = bars[self.COLUMNS]
+        return bars.astype({c: float for c in self.COLUMNS if c != 'ticks'}).astype({'ticks': np.int64})
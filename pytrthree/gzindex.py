@@ -0,0 +1,201 @@
+"""
+Sidecar per-RIC seek index for `RICSequence`-sorted TRTH .csv.gz parts.
+
+A one-time indexing pass records the uncompressed byte/row range of each RIC and
+(if `indexed_gzip` is installed) zran-style gzip access points, and saves them next
+to the part as `<part>.ricidx`. Reading a RIC then only decompresses the blocks covering it.
+Without `indexed_gzip`, reads still skip CSV parsing of other RICs and stop at the end
+of the requested range, but the data preceding it has to be decompressed.
+"""
+import gzip
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+logger = logging.getLogger('pytrthree')
+
+
+class RICIndex:
+    """
+    Index of RIC byte/row ranges (and gzip access points) of a TRTH .csv.gz part.
+
+    Sidecar file layout: a single JSON line with the metadata and RIC ranges,
+    followed by the binary `indexed_gzip` access point index (if any).
+    """
+
+    SUFFIX = '.ricidx'
+    VERSION = 1
+
+    def __init__(self, path, header: bytes, rics: dict, access_points: Optional[bytes] = None,
+                 size=None, mtime=None):
+        """
+        :param path: Path of the indexed .csv.gz file
+        :param header: CSV header line
+        :param rics: Dictionary of `{ric: (start_byte, end_byte, start_row, end_row)}`.
+                     Byte offsets refer to the uncompressed data, rows exclude the header.
+        :param access_points: Exported `indexed_gzip` index
+        :param size: Size of the indexed file (used to detect stale indexes)
+        :param mtime: Modification time of the indexed file (used to detect stale indexes)
+        """
+        self.path = path
+        self.header = header
+        self.rics = OrderedDict(rics)
+        self.access_points = access_points
+        self.size = size
+        self.mtime = mtime
+
+    def __contains__(self, ric):
+        return ric in self.rics
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r}, rics={len(self.rics)})'
+
+    @classmethod
+    def sidecar(cls, path) -> str:
+        return f'{path}{cls.SUFFIX}'
+
+    @classmethod
+    def build(cls, path, spacing=4 * 2 ** 20, save=True) -> 'RICIndex':
+        """
+        Scans a part once, recording RIC ranges and gzip access points.
+        :param path: Path of a TRTH .csv.gz file sorted by RIC
+        :param spacing: Number of uncompressed bytes between access points
+        :param save: Whether to write the sidecar index file
+        """
+        stat = os.stat(path)
+        if indexed_gzip is not None:
+            f = indexed_gzip.IndexedGzipFile(path, spacing=int(spacing))
+        else:
+            f = gzip.open(path, 'rb')
+        with f:
+            header = f.readline()
+            offset = len(header)
+            rics = OrderedDict()
+            current, start, start_row, row = None, offset, 0, 0
+            for line in f:
+                ric = line[:line.find(b',')].decode('utf-8')
+                if ric != current:
+                    if current is not None:
+                        rics[current] = (start, offset, start_row, row)
+                    if ric in rics:
+                        raise ValueError(f'{path} is not sorted by RIC ({ric} is not contiguous)')
+                    current, start, start_row = ric, offset, row
+                offset += len(line)
+                row += 1
+            if current is not None:
+                rics[current] = (start, offset, start_row, row)
+
+            access_points = None
+            if indexed_gzip is not None:
+                f.build_full_index()
+                buffer = io.BytesIO()
+                f.export_index(fileobj=buffer)
+                access_points = buffer.getvalue()
+
+        index = cls(path, header, rics, access_points, size=stat.st_size, mtime=stat.st_mtime)
+        if save:
+            index.save()
+        logger.debug(f'Indexed {path}: {len(rics)} RICs, {row} rows')
+        return index
+
+    def save(self, sidecar=None):
+        sidecar = sidecar or self.sidecar(self.path)
+        meta = dict(version=self.VERSION, header=self.header.decode('utf-8'),
+                    size=self.size, mtime=self.mtime, rics=self.rics,
+                    access_points=self.access_points is not None)
+        with open(sidecar, 'wb') as f:
+            f.write(json.dumps(meta).encode('utf-8') + b'\n')
+            if self.access_points is not None:
+                f.write(self.access_points)
+
+    @classmethod
+    def load(cls, path, sidecar=None) -> Optional['RICIndex']:
+        """
+        Loads the sidecar index of `path`.
+        :return: RICIndex, or None if the sidecar doesn't exist, is stale or unreadable.
+        """
+        sidecar = sidecar or cls.sidecar(path)
+        if not os.path.exists(sidecar):
+            return None
+        with open(sidecar, 'rb') as f:
+            try:
+                meta = json.loads(f.readline().decode('utf-8'))
+            except ValueError:
+                logger.warning(f'Ignoring invalid index: {sidecar}')
+                return None
+            access_points = f.read() if meta['access_points'] else None
+        stat = os.stat(path)
+        if meta['version'] != cls.VERSION or (meta['size'], meta['mtime']) != (stat.st_size, stat.st_mtime):
+            logger.warning(f'Ignoring stale index: {sidecar}')
+            return None
+        rics = OrderedDict((ric, tuple(r)) for ric, r in meta['rics'].items())
+        return cls(path, meta['header'].encode('utf-8'), rics, access_points,
+                   size=meta['size'], mtime=meta['mtime'])
+
+    @classmethod
+    def get(cls, path, build=False) -> Optional['RICIndex']:
+        """Loads the sidecar index of `path`, (re)building it if necessary and `build` is True"""
+        index = cls.load(path)
+        if index is None and build:
+            index = cls.build(path)
+        return index
+
+    def _open(self):
+        if self.access_points is not None and indexed_gzip is not None:
+            f = indexed_gzip.IndexedGzipFile(self.path)
+            f.import_index(fileobj=io.BytesIO(self.access_points))
+            return f
+        return gzip.open(self.path, 'rb')
+
+    def open(self, rics: Iterable[str]) -> io.BufferedReader:
+        """
+        Returns a binary file-like object with the CSV header followed by the rows of `rics`
+        (in file order). Only the data covering the requested RICs is decompressed.
+        """
+        ranges = sorted(self.rics[ric][:2] for ric in set(rics) if ric in self.rics)
+        return io.BufferedReader(_RangeReader(self._open(), self.header, ranges), buffer_size=2 ** 20)
+
+
+class _RangeReader(io.RawIOBase):
+    """Raw stream reading a header followed by byte ranges of a seekable file"""
+
+    def __init__(self, f, header: bytes, ranges):
+        self.f = f
+        self.pending = header
+        self.ranges = list(ranges)
+        self.remaining = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.pending:
+            n = min(len(b), len(self.pending))
+            b[:n] = self.pending[:n]
+            self.pending = self.pending[n:]
+            return n
+        while not self.remaining:
+            if not self.ranges:
+                return 0
+            start, end = self.ranges.pop(0)
+            self.f.seek(start)
+            self.remaining = end - start
+        data = self.f.read(min(len(b), self.remaining))
+        if not data:
+            raise EOFError('Unexpected end of file: index may be stale')
+        b[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.f.close()
+        super().close()
@@ -0,0 +1,359 @@
+"""
+Local stand-in for the TRTH SOAP service.
+
+Serves a TRTH WSDL (with its endpoint rewritten to the local server) and implements
+the operations wrapped by `TRTH` with synthetic data, so that client throughput and
+concurrency behaviour can be measured without network access or TRTH quota.
+Latency, faults and throttling can be injected through constructor options.
+"""
+import datetime
+import gzip
+import io
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Optional
+
+from lxml import etree
+from zeep import Client
+from zeep.helpers import serialize_object
+
+logger = logging.getLogger('pytrthree.mockserver')
+
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+WSDL_SOAP = 'http://schemas.xmlsoap.org/wsdl/soap/'
+
+
+class MockFault(Exception):
+    """Raised by operation handlers in order to reply with a SOAP Fault"""
+
+    def __init__(self, message, code='soap:Server'):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockTRTH:
+    """
+    Threaded HTTP server mimicking the TRTH SOAP API.
+
+    Usage:
+        with MockTRTH('TRTHApi.wsdl') as server:
+            api = TRTH(config={'credentials': {...}, 'log': '.', 'wsdl': server.wsdl_url})
+    """
+
+    THROTTLE_MESSAGE = 'Too many requests. Request throttled, please retry later.'
+
+    def __init__(self, wsdl, host='127.0.0.1', port=0, latency=0, fault_rate=0.0,
+                 rate_limit=None, processing_time=0.0, rows=1000, universe=None,
+                 renames=None, seed=None):
+        """
+        :param wsdl: Path (or URL) of a TRTH WSDL document
+        :param host: Interface to bind to
+        :param port: Port to bind to. Defaults to 0 (=random free port)
+        :param latency: Server-side delay (in seconds) added to every call.
+                        A `(low, high)` tuple gives a uniformly distributed delay.
+        :param fault_rate: Probability of any call failing with a SOAP Fault
+        :param rate_limit: Maximum sustained calls per second before throttling faults
+                           are returned. Defaults to None (=no throttling).
+        :param processing_time: Seconds a submitted request stays 'Processing'
+        :param rows: Number of rows generated for each `SubmitRequest` result
+        :param universe: List of RICs known by the server (used by SearchRICs/ExpandChain)
+        :param renames: Dictionary of `{ric: (new_ric, date)}` RIC changes (used by GetRICSymbology)
+        :param seed: Random seed for latency, fault injection and generated data
+        """
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self.rate_limit = rate_limit
+        self.processing_time = processing_time
+        self.rows = rows
+        self.universe = universe or [f'{code}.T' for code in range(1301, 9999, 7)]
+        self.renames = renames or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.faults = Counter()
+        self.tokens = {}
+        self.requests = {}
+        self._bucket = (float(rate_limit or 0), time.monotonic())
+
+        self.client = Client(wsdl, strict=True)
+        self.operations = {}
+        for service in self.client.wsdl.services.values():
+            for service_port in service.ports.values():
+                for op in service_port.binding._operations.values():
+                    self.operations[op.input.body.qname.localname] = op
+        self.handlers = {
+            'GetVersion': self.get_version,
+            'SearchRICs': self.search_rics,
+            'ExpandChain': self.expand_chain,
+            'GetRICSymbology': self.get_ric_symbology,
+            'SubmitRequest': self.submit_request,
+            'SubmitFTPRequest': self.submit_ftp_request,
+            'GetInflightStatus': self.get_status,
+            'GetRequestResult': self.get_request_result,
+            'CancelRequest': self.cancel_request,
+            'CleanUp': self.clean_up,
+        }
+
+        self.httpd = _ThreadingHTTPServer((host, port), self._make_handler())
+        self.wsdl_document = self._rewrite_wsdl(wsdl)
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/TRTHApi'
+
+    @property
+    def wsdl_url(self):
+        return f'{self.url}?wsdl'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f'Mock TRTH server listening on {self.url}')
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def serve_forever(self):
+        logger.info(f'Mock TRTH server listening on {self.url}')
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def _rewrite_wsdl(self, wsdl):
+        """Loads the WSDL document and points every SOAP address to this server"""
+        document = etree.fromstring(self.client.transport.load(wsdl))
+        for address in document.iter(f'{{{WSDL_SOAP}}}address'):
+            address.set('location', self.url)
+        return etree.tostring(document, xml_declaration=True, encoding='utf-8')
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._reply(200, server.wsdl_document)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                status, content = server.dispatch(self.rfile.read(length))
+                self._reply(status, content)
+
+            def _reply(self, status, content):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, fmt, *args):
+                logger.debug(fmt % args)
+
+        return Handler
+
+    def dispatch(self, content: bytes):
+        """
+        Parses a SOAP request, applies latency/fault/throttling settings
+        and calls the matching operation handler.
+        :return: Tuple of HTTP status code and response envelope
+        """
+        try:
+            envelope = etree.fromstring(content)
+            body = envelope.find(f'{{{SOAP_ENV}}}Body')
+            name = etree.QName(body[0]).localname
+            op = self.operations[name]
+        except (etree.XMLSyntaxError, TypeError, IndexError, KeyError):
+            return 500, self.make_fault('Invalid SOAP request', 'soap:Client')
+
+        with self.lock:
+            self.calls[name] += 1
+        try:
+            self._delay()
+            self._throttle()
+            if self.fault_rate and self.random.random() < self.fault_rate:
+                raise MockFault('Injected fault')
+            request = serialize_object(op.input.deserialize(envelope), target_cls=dict)
+            header = self._authenticate(name, (request['header'] or {}).get('CredentialsHeader'))
+            handler = self.handlers.get(name, lambda **kwargs: {})
+            resp = handler(**(request['body'] or {})) or {}
+            message = op.output.serialize(_soapheaders={'CredentialsHeader': header}, **resp)
+            return 200, etree.tostring(message.content)
+        except MockFault as fault:
+            with self.lock:
+                self.faults[name] += 1
+            return 500, self.make_fault(fault.message, fault.code)
+        except Exception as e:
+            logger.exception(f'{name} failed')
+            with self.lock:
+                self.faults[name] += 1
+            return 500, self.make_fault(f'Internal server error: {e!r}', 'soap:Server')
+
+    @staticmethod
+    def make_fault(message, code='soap:Server'):
+        nsmap = {'soap': SOAP_ENV}
+        envelope = etree.Element(f'{{{SOAP_ENV}}}Envelope', nsmap=nsmap)
+        fault = etree.SubElement(etree.SubElement(envelope, f'{{{SOAP_ENV}}}Body'),
+                                 f'{{{SOAP_ENV}}}Fault')
+        etree.SubElement(fault, 'faultcode').text = code
+        etree.SubElement(fault, 'faultstring').text = message
+        return etree.tostring(envelope, xml_declaration=True, encoding='utf-8')
+
+    def _delay(self):
+        if isinstance(self.latency, (tuple, list)):
+            delay = self.random.uniform(*self.latency)
+        else:
+            delay = self.latency
+        if delay:
+            time.sleep(delay)
+
+    def _throttle(self):
+        """Token bucket allowing `rate_limit` calls per second (with bursts of the same size)"""
+        if not self.rate_limit:
+            return
+        with self.lock:
+            tokens, last = self._bucket
+            now = time.monotonic()
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                self._bucket = (tokens, now)
+                raise MockFault(self.THROTTLE_MESSAGE)
+            self._bucket = (tokens - 1, now)
+
+    def _authenticate(self, operation, credentials):
+        """`GetVersion` issues a token which must be sent by every subsequent call"""
+        credentials = credentials or {}
+        if operation == 'GetVersion' and credentials.get('username'):
+            token = credentials.get('tokenId') or uuid.uuid4().hex
+            with self.lock:
+                self.tokens[token] = credentials['username']
+            return dict(username=credentials['username'], tokenId=token)
+        token = credentials.get('tokenId')
+        if token not in self.tokens:
+            raise MockFault('Invalid token. Please authenticate first.', 'soap:Client')
+        return dict(username=self.tokens[token], tokenId=token)
+
+    # Operation handlers: receive the request body as keyword arguments
+    # and return the response body as a dictionary.
+
+    def get_version(self, **kwargs):
+        return dict(version='mock')
+
+    def search_rics(self, dateRange=None, criteria=None, refData=False, **kwargs):
+        criteria = {d['field']: d['value'] for d in (criteria or {}).get('data') or []}
+        pattern = re.compile(str(criteria.get('RICRegex', '.*')))
+        rics = [ric for ric in self.universe if pattern.search(ric)]
+        return dict(instrumentList=dict(instrument=[dict(code=ric) for ric in rics]))
+
+    def expand_chain(self, instrument=None, **kwargs):
+        code = (instrument or {}).get('code') or ''
+        size = sum(map(ord, code)) % len(self.universe) + 1
+        rics = [code.split('#')[-1]] + self.universe[:size]
+        return dict(instrumentList=dict(instrument=[dict(code=ric) for ric in rics]))
+
+    def get_ric_symbology(self, instrument=None, dateRange=None, **kwargs):
+        code = (instrument or {}).get('code')
+        dateRange = dateRange or {}
+        results = []
+        if code in self.renames:
+            new_code, date = self.renames[code]
+            date = datetime.date(*map(int, str(date).split('-')))
+            if dateRange.get('start', date) <= date <= dateRange.get('end', date):
+                results.append(dict(code=code, newCode=new_code, date=date))
+        return dict(symbologyResultList=dict(symbologyResult=results))
+
+    def _new_request(self, request):
+        friendly_name = (request or {}).get('friendlyName') or 'request'
+        rid = f'mock@pytrthree-{friendly_name}-N{self.random.randrange(10 ** 9):09d}'
+        with self.lock:
+            self.requests[rid] = dict(request=request, submitted=time.monotonic(), status=None)
+        return dict(requestID=rid)
+
+    def submit_request(self, request=None, **kwargs):
+        return self._new_request(request)
+
+    def submit_ftp_request(self, request=None, **kwargs):
+        return self._new_request(request)
+
+    def _status(self, rid):
+        info = self.requests[rid]
+        if info['status'] is None and time.monotonic() - info['submitted'] >= self.processing_time:
+            info['status'] = 'Complete'
+        return info['status'] or 'Processing'
+
+    def get_status(self, **kwargs):
+        with self.lock:
+            active = sum(self._status(rid) == 'Processing' for rid in self.requests)
+            return dict(status=dict(active=active, total=len(self.requests)))
+
+    def get_request_result(self, requestID=None, **kwargs):
+        with self.lock:
+            if requestID not in self.requests:
+                raise MockFault(f'Unknown request ID: {requestID}', 'soap:Client')
+            status = self._status(requestID)
+            request = self.requests[requestID]['request']
+        if status != 'Complete' or 'instrument' not in (request or {}):
+            return dict(result=dict(status=status))
+        return dict(result=dict(status=status, data=self.make_data(request)))
+
+    def cancel_request(self, requestID=None, **kwargs):
+        with self.lock:
+            if requestID in self.requests:
+                self.requests[requestID]['status'] = 'Aborted'
+
+    def clean_up(self, **kwargs):
+        with self.lock:
+            self.requests.clear()
+
+    def make_data(self, request) -> bytes:
+        """Generates a gzipped TRTH-like CSV with `self.rows` trades for a RequestSpec"""
+        ric = request['instrument']['code']
+        date = request.get('date') or datetime.date.today()
+        rng = random.Random(f'{ric}{date}')
+        buffer = io.StringIO()
+        buffer.write('#RIC,Date[G],Time[G],GMT Offset,Type,Price,Volume\n')
+        price = rng.randint(100, 10000)
+        start = datetime.datetime.combine(date, datetime.time(0))
+        for i in range(self.rows):
+            timestamp = start + datetime.timedelta(microseconds=i * 21600 * 10 ** 6 // self.rows)
+            price = max(1, price + rng.randint(-2, 2))
+            buffer.write(f'{ric},{timestamp:%Y%m%d},{timestamp:%H:%M:%S.%f},9,Trade,'
+                         f'{price},{rng.randint(1, 50) * 100}\n')
+        return gzip.compress(buffer.getvalue().encode('utf-8'))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(calls=dict(self.calls), faults=dict(self.faults))
+
+
+def make_config(server: MockTRTH, log: Optional[str] = None) -> dict:
+    """Returns a `TRTH` configuration dictionary pointing to a `MockTRTH` server"""
+    return dict(credentials=dict(username='mock@pytrthree', password='mock'),
+                log=log or '.', wsdl=server.wsdl_url)
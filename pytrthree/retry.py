@@ -0,0 +1,267 @@
+"""
+Retry policy with full jitter, an overall deadline, fault classification
+and a circuit breaker which can be shared by all threads/coroutines using a `TRTH` client.
+"""
+import asyncio
+import copy
+import functools
+import logging
+import random
+import re
+import threading
+import time
+from typing import Optional, Sequence, Tuple, Type
+
+import requests
+import urllib3
+from zeep.exceptions import Fault, TransportError
+
+logger = logging.getLogger('pytrthree')
+
+FATAL_FAULTS = (r'(?i)invalid', r'(?i)not (?:permitted|entitled|authori[sz]ed)',
+                r'(?i)permission', r'(?i)authenticat', r'(?i)unknown request')
+RETRYABLE_EXCEPTIONS = (Fault, TransportError, requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout)
+
+
+def is_unsent(exc: Exception) -> bool:
+    """Whether a transport error was raised before the request was sent (i.e. while connecting)"""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        reason = getattr(exc.args[0], 'reason', exc.args[0])
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited by an open `CircuitBreaker`"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Circuit open. Retry after {retry_after:.1f} seconds.')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+    Opens after `failure_threshold` consecutive failures, rejecting all calls for
+    `recovery_time` seconds. Afterwards a single probe call is let through (half-open):
+    success closes the circuit while failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_time=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            elif time.monotonic() - self.opened_at < self.recovery_time:
+                return 'open'
+            else:
+                return 'half-open'
+
+    def before_call(self) -> bool:
+        """
+        Raises `CircuitOpenError` unless the caller is allowed to proceed.
+        :return: True if the caller is the half-open probe
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.recovery_time - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            if self.probing:
+                raise CircuitOpenError(min(1, self.recovery_time))
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info('Circuit closed.')
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logger.warning(f'Circuit opened for {self.recovery_time} seconds '
+                               f'after {self.failures} consecutive failures.')
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self):
+        """Releases the half-open probe slot without recording an outcome"""
+        with self.lock:
+            self.probing = False
+
+
+class RetryPolicy:
+    """
+    Reusable retry policy.
+    Waits `uniform(0, min(cap, base * multiplier ** attempt))` seconds between attempts (full jitter),
+    gives up after `max_attempts` attempts or once `deadline` seconds have elapsed, and
+    never retries fatal faults (e.g. authentication/permission errors).
+    The policy object (and its circuit breaker) is meant to be shared, e.g. via `TRTH.options['retry']`.
+    """
+
+    def __init__(self, max_attempts=5, base=1, multiplier=2, cap=60, deadline: Optional[float] = 300,
+                 retry_on: Tuple[Type[Exception], ...] = RETRYABLE_EXCEPTIONS,
+                 fatal: Sequence[str] = FATAL_FAULTS,
+                 breaker: Optional[CircuitBreaker] = None, seed=None, idempotent=True):
+        """
+        :param max_attempts: Maximum number of attempts (including the first call)
+        :param base: Initial backoff in seconds
+        :param multiplier: Base of the exponential backoff
+        :param cap: Maximum backoff in seconds. None means no cap.
+        :param deadline: Overall time budget in seconds for all attempts. None means no deadline.
+        :param retry_on: Exception classes considered retryable
+        :param fatal: Regular expressions matched against `Fault` messages which must not be retried
+        :param breaker: Circuit breaker shared by all users of this policy. Defaults to a new one.
+                        Pass `False` to disable.
+        :param seed: Random seed used for jitter
+        :param idempotent: Whether calls can be safely repeated. If False, transport errors are only
+                           retried if raised before the request was sent (see `is_unsent`).
+        """
+        self.max_attempts = max_attempts
+        self.base = base
+        self.multiplier = multiplier
+        self.cap = cap
+        self.deadline = deadline
+        self.retry_on = tuple(retry_on)
+        self.fatal = [re.compile(pattern) for pattern in fatal]
+        self.breaker = CircuitBreaker() if breaker is None else breaker or None
+        self.random = random.Random(seed)
+        self.idempotent = idempotent
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Optional['RetryPolicy']:
+        """Makes a policy from the `retry` key of a TRTH YAML configuration"""
+        if not config:
+            return None
+        config = dict(config)
+        breaker = config.pop('breaker', None)
+        if isinstance(breaker, dict):
+            breaker = CircuitBreaker(**breaker)
+        return cls(breaker=breaker, **config)
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, CircuitOpenError):
+            return True
+        if not isinstance(exc, self.retry_on):
+            return False
+        if isinstance(exc, Fault):
+            return not any(pattern.search(str(exc.message)) for pattern in self.fatal)
+        return self.idempotent or is_unsent(exc)
+
+    def non_idempotent(self) -> 'RetryPolicy':
+        """
+        Returns a copy of this policy (sharing its circuit breaker) for calls which must not be
+        repeated once sent (e.g. request submissions), since a read timeout doesn't mean
+        the server didn't accept the call.
+        """
+        if not self.idempotent:
+            return self
+        policy = copy.copy(self)
+        policy.idempotent = False
+        return policy
+
+    def backoff(self, attempt: int) -> float:
+        delay = self.base * self.multiplier ** attempt
+        if self.cap is not None:
+            delay = min(self.cap, delay)
+        return self.random.uniform(0, delay)
+
+    def _next_delay(self, attempt, exc, start):
+        """Returns delay before next attempt, or re-raises `exc` if giving up"""
+        if not self.is_retryable(exc) or attempt >= self.max_attempts - 1:
+            raise exc
+        delay = self.backoff(attempt)
+        if isinstance(exc, CircuitOpenError):
+            delay += exc.retry_after
+        if self.deadline is not None and time.monotonic() - start + delay > self.deadline:
+            raise exc
+        logger.info(f'Retrying in {delay:.2f} seconds (#{attempt + 1})...')
+        return delay
+
+    def _record(self, exc=None):
+        if self.breaker is None:
+            return
+        if exc is None:
+            self.breaker.record_success()
+        elif isinstance(exc, CircuitOpenError):
+            pass
+        elif isinstance(exc, Fault) and not self.is_retryable(exc):
+            # Fatal faults mean the service is reachable
+            self.breaker.record_success()
+        elif isinstance(exc, self.retry_on):
+            # Counted even if not retried (e.g. read timeouts of non-idempotent calls)
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    def call(self, func, *args, **kwargs):
+        """Calls `func(*args, **kwargs)`, retrying according to this policy"""
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            probe = False
+            try:
+                probe = self.breaker.before_call() if self.breaker is not None else False
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    if probe:
+                        self.breaker.release()
+                    raise
+                self._record(e)
+                if not isinstance(e, CircuitOpenError):
+                    logger.error(e)
+                time.sleep(self._next_delay(attempt, e, start))
+            else:
+                self._record()
+                return result
+
+    async def call_async(self, func, *args, **kwargs):
+        """Awaits `func(*args, **kwargs)`, retrying according to this policy"""
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            probe = False
+            try:
+                probe = self.breaker.before_call() if self.breaker is not None else False
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    if probe:
+                        self.breaker.release()
+                    raise
+                self._record(e)
+                if not isinstance(e, CircuitOpenError):
+                    logger.error(e)
+                await asyncio.sleep(self._next_delay(attempt, e, start))
+            else:
+                self._record()
+                return result
+
+    def __call__(self, func):
+        """Decorator version of `call`/`call_async`"""
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(func, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
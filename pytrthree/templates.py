@@ -0,0 +1,173 @@
+"""
+Registry of `RequestSpec`/`LargeRequestSpec` YAML templates.
+
+Each template is parsed and validated against the WSDL types once (and again only
+if the file's mtime changes). `TemplateRegistry.clone` returns copy-on-write clones:
+only the objects along overridden paths are copied, everything else is shared
+with the cached template, so clones must be modified through overrides only.
+"""
+import copy
+import glob
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+import yaml
+from zeep.xsd.valueobjects import CompoundValue
+
+# Installed with the package (see `package_data` in setup.py)
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'request_templates')
+
+_registries = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+def shallow_copy(obj):
+    """Copies a zeep CompoundValue/dict/list without copying its children"""
+    if isinstance(obj, CompoundValue):
+        new = type(obj).__new__(type(obj))
+        new.__values__ = OrderedDict(obj.__values__)
+        for attr, value in obj.__dict__.items():
+            if attr != '__values__':
+                setattr(new, attr, value)
+        return new
+    elif isinstance(obj, (dict, list)):
+        return copy.copy(obj)
+    else:
+        raise TypeError(f'Cannot copy {type(obj)}')
+
+
+def set_path(obj, path, value):
+    """
+    Returns a copy of `obj` with `value` set at `path` (a sequence of keys/list indexes).
+    Only the objects along `path` are copied.
+    """
+    head, rest = path[0], path[1:]
+    new = shallow_copy(obj)
+    if isinstance(new, list):
+        head = int(head)
+    new[head] = set_path(new[head], rest, value) if rest else value
+    return new
+
+
+class Template:
+    """Parsed and validated request template"""
+
+    def __init__(self, path, type_name, obj, mtime):
+        self.path = path
+        self.type_name = type_name
+        self.obj = obj
+        self.mtime = mtime
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r}, {self.type_name})'
+
+
+class TemplateRegistry:
+    """
+    Thread-safe cache of request templates, keyed by path and modification time.
+    Templates can be referred to by path or by name (file name without extension)
+    of files in `directory`.
+    """
+
+    def __init__(self, factory, directory=TEMPLATE_DIR):
+        """
+        :param factory: Zeep type factory (`TRTH.factory`)
+        :param directory: Directory of named templates
+        """
+        self.factory = factory
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    @classmethod
+    def for_factory(cls, factory) -> 'TemplateRegistry':
+        """Returns the registry shared by all users of `factory`"""
+        with _registries_lock:
+            if factory not in _registries:
+                _registries[factory] = cls(factory)
+            return _registries[factory]
+
+    @property
+    def names(self) -> list:
+        if not self.directory:
+            return []
+        return sorted(os.path.splitext(os.path.basename(f))[0]
+                      for f in glob.glob(os.path.join(self.directory, '*.yml')))
+
+    def resolve(self, template) -> str:
+        """Returns the absolute path of a template name/path"""
+        path = os.path.expanduser(template)
+        if not os.path.exists(path) and self.directory:
+            named = os.path.join(self.directory, f'{template}.yml')
+            if os.path.exists(named):
+                path = named
+        if not os.path.exists(path):
+            raise ValueError(f'Template not found: {template}')
+        return os.path.abspath(path)
+
+    @staticmethod
+    def infer_type(data: dict) -> str:
+        return 'LargeRequestSpec' if 'instrumentList' in data or 'dateRange' in data else 'RequestSpec'
+
+    def get(self, template, type_name: Optional[str] = None) -> Template:
+        """
+        Returns a cached template, parsing and validating it if needed.
+        :param template: Template path or name
+        :param type_name: WSDL type of the template. Inferred if not given.
+        """
+        path = self.resolve(template)
+        mtime = os.stat(path).st_mtime
+        with self.lock:
+            cached = self.cache.get(path)
+        if cached is None or cached.mtime != mtime or (type_name and cached.type_name != type_name):
+            with open(path) as f:
+                data = yaml.safe_load(f)
+            type_name = type_name or self.infer_type(data)
+            # Zeep raises TypeError for fields not in the WSDL type
+            obj = getattr(self.factory, type_name)(**data)
+            cached = Template(path, type_name, obj, mtime)
+            with self.lock:
+                self.cache[path] = cached
+        return cached
+
+    def _expand_override(self, type_name, key, value):
+        """Translates shortcut overrides into a (path, value) tuple"""
+        if key == 'instruments':
+            if isinstance(value, str):
+                value = [value]
+            if type_name == 'RequestSpec':
+                return ['instrument'], self.factory.Instrument(code=value[0])
+            return ['instrumentList', 'instrument'], [self.factory.Instrument(code=ric) for ric in value]
+        elif key == 'fields':
+            return ['messageTypeList', 'messageType', 0, 'fieldList', 'string'], list(value)
+        elif key == 'dateRange' and type_name == 'RequestSpec':
+            return ['date'], value['start'] if isinstance(value, dict) else value
+        else:
+            return key.split('.'), value
+
+    def clone(self, template, type_name: Optional[str] = None, **overrides) -> CompoundValue:
+        """
+        Returns a copy-on-write clone of a template.
+        :param template: Template path or name
+        :param type_name: WSDL type of the template. Inferred if not given.
+        :param overrides: Field overrides. Besides top level fields and dotted paths
+                          (e.g. `timeRange.start`), the following shortcuts are supported:
+                          `instruments` (list of RICs), `fields` (list of fields of the first
+                          message type) and `dateRange` (also valid for `RequestSpec`).
+        """
+        cached = self.get(template, type_name)
+        obj = shallow_copy(cached.obj)
+        for key, value in overrides.items():
+            path, value = self._expand_override(cached.type_name, key, value)
+            if path[0] not in obj:
+                raise TypeError(f'{cached.type_name} has no field {path[0]!r}')
+            obj = set_path(obj, path, value)
+        return obj
+
+    def preload(self):
+        """Parses and validates all templates in `self.directory`"""
+        for name in self.names:
+            self.get(name)
@@ -0,0 +1,273 @@
+"""
+Transcoding of TRTH .csv.gz parts into seekable, multi-frame zstd files.
+
+`<part>.csv.gz` is transcoded into `<part>.csv.zst` (keeping the TRTH file naming convention):
+the CSV is split at line boundaries into independently compressed zstd frames, which can be
+decompressed in parallel, and a frame index (header, per-frame sizes, row counts and RICs,
+source size/mtime/row count) is appended as a zstd skippable frame. The result is still a
+standard .zst file (`zstd -d` restores the original CSV).
+
+Requires the optional `zstandard` package.
+"""
+import gzip
+import io
+import json
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('pytrthree')
+
+SKIPPABLE_MAGIC = 0x184D2A5E
+INDEX_MAGIC = b'TZIX'
+
+
+def zst_path(path) -> str:
+    """Returns the .zst path corresponding to a TRTH .csv.gz (or .csv) part"""
+    root = path[:-3] if path.endswith('.gz') else path
+    return f'{root}.zst'
+
+
+def source_path(path) -> str:
+    """Returns the .csv.gz path corresponding to a transcoded part"""
+    return f'{path[:-4]}.gz'
+
+
+class ZstdPart:
+    """Frame index of a transcoded TRTH part"""
+
+    VERSION = 1
+
+    def __init__(self, path, header: bytes, frames: list, source: Optional[dict] = None):
+        """
+        :param path: Path of the .zst file
+        :param header: CSV header line
+        :param frames: List of `[offset, compressed_size, uncompressed_size, rows, rics]`.
+                       The first frame includes the header (not counted in `rows`).
+        :param source: Size, modification time and row count of the transcoded .csv.gz file
+        """
+        self.path = path
+        self.header = header
+        self.frames = frames
+        self.source = source or {}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r}, frames={len(self.frames)}, rows={self.rows})'
+
+    @property
+    def rows(self) -> int:
+        return sum(frame[3] for frame in self.frames)
+
+    @classmethod
+    def transcode(cls, path, output=None, level=9, frame_size=4 * 2 ** 20, threads=None,
+                  verify=True) -> 'ZstdPart':
+        """
+        Transcodes a .csv.gz part into a multi-frame .zst file.
+        :param path: Path of a TRTH .csv.gz file
+        :param output: Output path. Defaults to `<part>.csv.zst`.
+        :param level: zstd compression level
+        :param frame_size: Approximate number of uncompressed bytes per frame
+        :param threads: Number of compression threads. Defaults to the number of CPUs.
+        :param verify: Whether to decompress the output and compare its row count with the source
+        """
+        if zstandard is None:
+            raise ImportError('Transcoding requires the `zstandard` package')
+        output = output or zst_path(path)
+        stat = os.stat(path)
+        local = threading.local()
+
+        def compress(data):
+            if not hasattr(local, 'compressor'):
+                local.compressor = zstandard.ZstdCompressor(level=level, write_content_size=True)
+            return local.compressor.compress(data)
+
+        threads = threads or os.cpu_count()
+        frames, rows = [], 0
+        tmp = f'{output}.tmp'
+        with gzip.open(path, 'rb') as src, open(tmp, 'wb') as dst, ThreadPoolExecutor(threads) as executor:
+            header = src.readline()
+            # The header is part of the first frame, so that the file decompresses to the original CSV
+            blocks = [[header] + src.readlines(frame_size)]
+            while True:
+                lines = src.readlines(frame_size)
+                if lines:
+                    blocks.append(lines)
+                if len(blocks) >= 4 * threads or (blocks and not lines):
+                    rows += cls._write_frames(executor, compress, blocks, frames, dst)
+                    blocks = []
+                if not lines:
+                    break
+            source = dict(size=stat.st_size, mtime=stat.st_mtime, rows=rows)
+            part = cls(output, header, frames, source)
+            part._write_index(dst)
+        os.replace(tmp, output)
+
+        if verify:
+            part.verify()
+        logger.debug(f'Transcoded {path}: {len(frames)} frames, {rows} rows, '
+                     f'{stat.st_size / os.path.getsize(output):.2f}x smaller')
+        return part
+
+    @staticmethod
+    def _write_frames(executor, compress, blocks, frames, f) -> int:
+        rows = 0
+        data = [b''.join(lines) for lines in blocks]
+        for lines, raw, compressed in zip(blocks, data, executor.map(compress, data)):
+            skip = 0 if frames else 1  # Header
+            rics = list(OrderedDict.fromkeys(line[:line.find(b',')].decode('utf-8') for line in lines[skip:]))
+            frames.append([f.tell(), len(compressed), len(raw), len(lines) - skip, rics])
+            f.write(compressed)
+            rows += len(lines) - skip
+        return rows
+
+    def _write_index(self, f):
+        meta = dict(version=self.VERSION, header=self.header.decode('utf-8'),
+                    frames=self.frames, source=self.source)
+        payload = json.dumps(meta).encode('utf-8')
+        payload += struct.pack('<I', len(payload)) + INDEX_MAGIC
+        f.write(struct.pack('<II', SKIPPABLE_MAGIC, len(payload)) + payload)
+
+    @classmethod
+    def load(cls, path) -> Optional['ZstdPart']:
+        """
+        Loads the frame index of a transcoded part.
+        :return: ZstdPart, or None if `path` doesn't exist or is not a transcoded part
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            f.seek(0, io.SEEK_END)
+            if f.tell() < 8:
+                return None
+            f.seek(-8, io.SEEK_END)
+            size, magic = struct.unpack('<I4s', f.read(8))
+            if magic != INDEX_MAGIC:
+                logger.warning(f'Ignoring {path} (no frame index)')
+                return None
+            f.seek(-8 - size, io.SEEK_END)
+            meta = json.loads(f.read(size).decode('utf-8'))
+        if meta['version'] != cls.VERSION:
+            logger.warning(f'Ignoring {path} (unsupported version)')
+            return None
+        return cls(path, meta['header'].encode('utf-8'), meta['frames'], meta['source'])
+
+    @classmethod
+    def get(cls, path) -> Optional['ZstdPart']:
+        """
+        Returns the transcoded part of a .csv.gz part (or of itself if `path` is a .zst file),
+        or None if there is none, it is older than its source or `zstandard` is not installed.
+        """
+        if zstandard is None:
+            return None
+        if path.endswith('.zst'):
+            path, part = source_path(path), cls.load(path)
+        else:
+            part = cls.load(zst_path(path))
+        if part is not None and os.path.exists(path) and not part.matches(path):
+            logger.warning(f'Ignoring stale {part.path}')
+            return None
+        return part
+
+    def matches(self, path) -> bool:
+        """Whether this part was transcoded from the current version of `path`"""
+        stat = os.stat(path)
+        return (self.source.get('size'), self.source.get('mtime')) == (stat.st_size, stat.st_mtime)
+
+    def select(self, rics: Optional[Iterable[str]] = None) -> list:
+        """Returns the indexes of frames containing any of `rics` (all frames if None)"""
+        if rics is None:
+            return list(range(len(self.frames)))
+        rics = set(rics)
+        return [i for i, frame in enumerate(self.frames) if rics.intersection(frame[4])]
+
+    def open(self, rics: Optional[Iterable[str]] = None, threads=None) -> io.BufferedReader:
+        """
+        Returns a binary file-like object with the CSV header followed by the frames
+        containing `rics` (all frames if None), decompressed in parallel.
+        """
+        if zstandard is None:
+            raise ImportError('Reading transcoded parts requires the `zstandard` package')
+        frames = [self.frames[i] for i in self.select(rics)]
+        return io.BufferedReader(_FrameReader(self, frames, threads), buffer_size=2 ** 20)
+
+    def verify(self):
+        """Decompresses all frames and checks their row counts against the index and the source"""
+        rows = 0
+        with self.open() as f:
+            for line in f:
+                rows += 1
+        rows -= 1  # Header
+        if rows != self.rows or rows != self.source.get('rows', rows):
+            raise ValueError(f'{self.path}: row count mismatch '
+                             f'(read {rows}, index {self.rows}, source {self.source.get("rows")})')
+
+
+class _FrameReader(io.RawIOBase):
+    """Raw stream decompressing zstd frames in parallel (in order)"""
+
+    def __init__(self, part: ZstdPart, frames: list, threads=None):
+        self.f = open(part.path, 'rb')
+        self.frames = frames
+        self.pending = memoryview(b'' if frames and frames[0][0] == 0 else part.header)
+        self.threads = threads or os.cpu_count()
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.futures = []
+        self.results = self._decompress()
+
+    def _read_frame(self, frame):
+        offset, size = frame[:2]
+        with self.lock:
+            self.f.seek(offset)
+            data = self.f.read(size)
+        if not hasattr(self.local, 'decompressor'):
+            self.local.decompressor = zstandard.ZstdDecompressor()
+        data = self.local.decompressor.decompress(data)
+        # Verified before any of its data is returned
+        rows = data.count(b'\n') + (not data.endswith(b'\n')) - (offset == 0)
+        if rows != frame[3]:
+            raise ValueError(f'{self.f.name}: frame at offset {offset} has {rows} rows, expected {frame[3]}')
+        return memoryview(data)
+
+    def _decompress(self):
+        window = 2 * self.threads
+        self.futures = [self.executor.submit(self._read_frame, frame) for frame in self.frames[:window]]
+        for i in range(len(self.frames)):
+            if i + window < len(self.frames):
+                self.futures.append(self.executor.submit(self._read_frame, self.frames[i + window]))
+            yield self.futures[i].result()
+            self.futures[i] = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            data = next(self.results, None)
+            if data is None:
+                return 0
+            self.pending = data
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            # Frames read ahead but not consumed (e.g. the reader was closed early)
+            for future in self.futures:
+                if future is not None:
+                    future.cancel()
+            self.executor.shutdown(wait=True)
+            self.f.close()
+        super().close()
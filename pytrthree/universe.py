@@ -0,0 +1,195 @@
+"""
+Bulk chain expansion and RIC symbology resolution.
+
+Results are memoized per (RIC, day), so overlapping date ranges reuse earlier answers
+of the same client (each `TRTH` instance has its own in-memory cache by default) or,
+using a persistent `DayCache`, across runs.
+"""
+import datetime
+import logging
+import os
+import shelve
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from . import utils
+
+logger = logging.getLogger('pytrthree')
+
+
+class DayCache:
+    """
+    Thread-safe memo of API results keyed by (function, RIC, day).
+    Persisted to disk (using `shelve`) if `path` is given.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.path.expanduser(path) if path else None
+        self.lock = threading.Lock()
+        self.data = shelve.open(self.path) if self.path else {}
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.data
+
+    def __len__(self):
+        with self.lock:
+            return len(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def make_key(function: str, ric: str, day: datetime.date, extra='') -> str:
+        return f'{function}|{ric}|{day:%Y-%m-%d}|{extra}'
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def close(self):
+        if self.path:
+            with self.lock:
+                self.data.close()
+
+    @classmethod
+    def for_api(cls, api) -> 'DayCache':
+        """Returns the in-memory cache of `api`, so that results of different clients/endpoints are not mixed"""
+        with _caches_lock:
+            if api not in _caches:
+                _caches[api] = cls()
+            return _caches[api]
+
+
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def make_days(dateRange: dict) -> List[datetime.date]:
+    """Returns all days between `dateRange['start']` and `dateRange['end']` (inclusive)"""
+    start = pd.Timestamp(dateRange['start']).date()
+    end = pd.Timestamp(dateRange['end']).date()
+    if start > end:
+        raise ValueError(f'Invalid date range: {start} > {end}')
+    return [ts.date() for ts in pd.date_range(start, end)]
+
+
+def make_spans(days: Iterable[datetime.date]) -> List[Tuple[datetime.date, datetime.date]]:
+    """Groups days into (start, end) spans of consecutive days"""
+    spans = []
+    for day in sorted(days):
+        if spans and (day - spans[-1][1]).days == 1:
+            spans[-1] = (spans[-1][0], day)
+        else:
+            spans.append((day, day))
+    return spans
+
+
+def _call(api, function, params, max_workers):
+    """
+    Calls `function` concurrently, returning results and errors.
+    Faults are always raised (regardless of `api.raise_exception`), so that failed calls
+    are reported instead of being silently missing from the results.
+    """
+    results = api.map(function, params, max_workers=max_workers, return_exceptions=True, raise_exception=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    return results, errors
+
+
+def expand_chains(api, chains: Iterable[str], dateRange: dict, cache: Optional[DayCache] = None,
+                  max_workers=None, by_day=False, **kwargs) -> Dict[str, list]:
+    """
+    Expands many chain RICs concurrently, one day at a time.
+    :param api: `TRTH` instance
+    :param chains: Chain RICs (e.g. '0#.N225'). Duplicates are ignored.
+    :param dateRange: Dictionary with (inclusive) `start` and `end` dates
+    :param cache: Memo of previous results. Defaults to the in-memory cache of `api`.
+    :param max_workers: Number of threads. Defaults to `api.pool_size`.
+    :param by_day: Whether to return `{chain: {day: members}}` instead of `{chain: members}`
+    :param kwargs: Extra `expand_chain` parameters (e.g. `timeRange`, `requestInGMT`)
+    :return: Dictionary of sorted chain members over the whole date range
+    """
+    cache = DayCache.for_api(api) if cache is None else cache
+    chains = list(OrderedDict.fromkeys(chains))
+    days = make_days(dateRange)
+    extra = repr(sorted(kwargs.items()))
+
+    keys = {(chain, day): cache.make_key('ExpandChain', chain, day, extra) for chain in chains for day in days}
+    missing = [(chain, day) for (chain, day), key in keys.items() if key not in cache]
+    logger.debug(f'Expanding chains: {len(keys) - len(missing)} cached, {len(missing)} missing')
+    params = [dict(instrument=chain, dateRange=dict(start=day, end=day), **kwargs) for chain, day in missing]
+    results, errors = _call(api, 'expand_chain', params, max_workers)
+    for item, result in zip(missing, results):
+        if result is not None and not isinstance(result, Exception):
+            cache.set(keys[item], result)
+    if errors:
+        raise errors[0]
+
+    output = OrderedDict()
+    for chain in chains:
+        members = OrderedDict((day, cache.get(keys[chain, day])) for day in days)
+        members = OrderedDict((day, m) for day, m in members.items() if m is not None)
+        if by_day:
+            output[chain] = members
+        else:
+            output[chain] = sorted({ric for m in members.values() for ric in m})
+    return output
+
+
+def _record_day(record, span):
+    """Returns the day of a symbology record (or the start of its span if not available)"""
+    date = record.get('date') if isinstance(record, dict) else None
+    if date is None:
+        return span[0]
+    date = pd.Timestamp(date).date()
+    return date if span[0] <= date <= span[1] else span[0]
+
+
+def resolve_symbology(api, rics: Iterable[str], dateRange: dict, cache: Optional[DayCache] = None,
+                      max_workers=None) -> Dict[str, list]:
+    """
+    Gets RIC symbology (e.g. renames) for many RICs concurrently.
+    Only days not yet in `cache` are queried, using one call per span of consecutive days.
+    :param api: `TRTH` instance
+    :param rics: RICs to be resolved. Duplicates are ignored.
+    :param dateRange: Dictionary with (inclusive) `start` and `end` dates
+    :param cache: Memo of previous results. Defaults to the in-memory cache of `api`.
+    :param max_workers: Number of threads. Defaults to `api.pool_size`.
+    :return: Dictionary of `{ric: list of symbology records}`
+    """
+    cache = DayCache.for_api(api) if cache is None else cache
+    rics = list(OrderedDict.fromkeys(rics))
+    days = make_days(dateRange)
+
+    keys = {(ric, day): cache.make_key('GetRICSymbology', ric, day) for ric in rics for day in days}
+    spans = [(ric, span) for ric in rics
+             for span in make_spans(day for day in days if keys[ric, day] not in cache)]
+    logger.debug(f'Resolving symbology: {len(spans)} calls')
+    params = [dict(instrument=ric, dateRange=dict(start=start, end=end)) for ric, (start, end) in spans]
+    results, errors = _call(api, 'get_ric_symbology', params, max_workers)
+    for (ric, span), result in zip(spans, results):
+        if result is None or isinstance(result, Exception):
+            continue
+        records = utils.base_parser(result) or []
+        if not isinstance(records, list):
+            records = [records]
+        by_day = {day: [] for day in make_days(dict(start=span[0], end=span[1]))}
+        for record in records:
+            by_day[_record_day(record, span)].append(record)
+        for day, day_records in by_day.items():
+            cache.set(keys[ric, day], day_records)
+    if errors:
+        raise errors[0]
+
+    return OrderedDict((ric, [r for day in days for r in cache.get(keys[ric, day], [])]) for ric in rics)
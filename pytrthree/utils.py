@@ -1,9 +1,15 @@
+import atexit
+import copy
 import datetime
 import io
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import re
 import sys
+import threading
 import time
 from zeep.exceptions import Fault
 
@@ -11,40 +17,196 @@ import pandas as pd
 import yaml
 from zeep.xsd.valueobjects import CompoundValue
 
+from .retry import RetryPolicy
+from .templates import TemplateRegistry
+
 logger = logging.getLogger('pytrthree')
 
 
+LOG_DEFAULTS = dict(path=None, format='text', level='DEBUG', console_level='INFO',
+                    progress_interval=5, queue=True)
+_log_options = {}
+_log_listeners = {}  # Running (listener, queue) pairs, by logger name
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as JSON lines, including structured fields passed with `extra`"""
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        data = dict(time=self.formatTime(record, self.datefmt), name=record.name,
+                    level=record.levelname, message=record.getMessage())
+        data.update({k: v for k, v in vars(record).items() if k not in self.RESERVED})
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def log_options(config=None) -> dict:
+    """
+    Parses the `log` configuration key, which can be either a log directory
+    or a dictionary with any of the keys of `LOG_DEFAULTS`.
+    """
+    log = config.get('log') if config else None
+    if not isinstance(log, dict):
+        log = dict(path=log)
+    options = {**LOG_DEFAULTS, **{k: v for k, v in log.items() if v is not None}}
+    unknown = set(options) - set(LOG_DEFAULTS)
+    if unknown:
+        raise ValueError(f'Invalid log options: {unknown}')
+    options['path'] = os.path.expanduser(options['path'] or os.getcwd())
+    return options
+
+
 def make_logger(name, config=None) -> logging.Logger:
-    log_path = os.path.expanduser(config['log']) if config else os.getcwd()
-    if not os.path.exists(log_path):
-        os.makedirs(log_path)
-    fname = os.path.join(log_path, f'{name}.log')
+    """
+    Makes a logger writing to `<log path>/<name>.log` and to the console.
+    Unless `queue: false` is configured, records are handed to a background
+    thread through a queue, so that logging never blocks on I/O.
+    Loggers made by this function are reconfigured if called again with a different `config`.
+    """
     logger = logging.getLogger(name)
+    options = log_options(config)
     if logger.handlers:
-        return logger
+        if name not in _log_options or config is None or _log_options[name] == options:
+            return logger
+        _remove_handlers(logger)
+    if not os.path.exists(options['path']):
+        os.makedirs(options['path'])
+    fname = os.path.join(options['path'], f'{name}.log')
     logger.setLevel(logging.DEBUG)
     formatter = logging.Formatter(fmt='{asctime} | {name} | {levelname}: {message}',
                                   datefmt='%Y-%m-%d %H:%M:%S', style='{')
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
-    stream_handler.setLevel(logging.INFO)
+    stream_handler.setLevel(options['console_level'])
 
     file_handler = logging.FileHandler(filename=fname, mode='a')
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    file_handler.setFormatter(JSONFormatter() if options['format'] == 'json' else formatter)
+    file_handler.setLevel(options['level'])
+
+    if options['queue']:
+        log_queue = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler,
+                                                  respect_handler_level=True)
+        listener.start()
+        _log_listeners[name] = (listener, log_queue)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(stream_handler)
+    _log_options[name] = options
 
     return logger
 
 
+def _remove_handlers(logger):
+    """Removes (and closes) the handlers added by `make_logger`"""
+    listener, _ = _log_listeners.pop(logger.name, (None, None))
+    handlers = list(logger.handlers)
+    if listener is not None:
+        listener.stop()
+        handlers += listener.handlers
+    for handler in handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    _log_options.pop(logger.name, None)
+
+
+def flush_logger(name):
+    """Waits until all queued records of logger `name` have been written"""
+    if name in _log_listeners:
+        # QueueListener marks each record as done once all handlers have processed it
+        _log_listeners[name][1].join()
+
+
+@atexit.register
+def _stop_listeners():
+    while _log_listeners:
+        _, (listener, _) = _log_listeners.popitem()
+        listener.stop()
+
+
+class Progress:
+    """
+    Rate-limited progress events.
+    Counters passed to `update` are accumulated and a single INFO record, with
+    `rows`/`bytes` totals and `rows_per_sec`/`bytes_per_sec` rates as structured fields,
+    is emitted at most every `interval` seconds. `close` emits a final summary.
+    """
+
+    def __init__(self, logger, label, interval=None):
+        """
+        :param logger: Logger to emit progress events to
+        :param label: Progress description (e.g. file name)
+        :param interval: Minimum number of seconds between events.
+                         Defaults to the `progress_interval` log option.
+        """
+        self.logger = logger
+        self.label = label
+        if interval is None:
+            interval = _log_options.get(logger.name, LOG_DEFAULTS)['progress_interval']
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.start = self.last = time.monotonic()
+        self.totals = dict(rows=0, bytes=0)
+        self.last_totals = dict(self.totals)
+        self.fields = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, rows=0, bytes=0, **fields):
+        """
+        :param rows: Number of rows processed since last update
+        :param bytes: Number of bytes processed since last update
+        :param fields: Extra fields attached to the next event (e.g. `completed=3`)
+        """
+        with self.lock:
+            self.totals['rows'] += rows
+            self.totals['bytes'] += bytes
+            self.fields.update(fields)
+            now = time.monotonic()
+            if now - self.last < self.interval:
+                return
+            elapsed, since = now - self.last, dict(self.last_totals)
+            self.last, self.last_totals = now, dict(self.totals)
+        self._emit(elapsed, since)
+
+    def close(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.start
+        self._emit(elapsed, dict(rows=0, bytes=0), final=True)
+
+    def _emit(self, elapsed, since, final=False):
+        elapsed = max(elapsed, 1e-9)
+        rows, nbytes = self.totals['rows'], self.totals['bytes']
+        event = dict(progress=self.label, rows=rows, bytes=nbytes, final=final,
+                     rows_per_sec=round((rows - since['rows']) / elapsed, 1),
+                     bytes_per_sec=round((nbytes - since['bytes']) / elapsed, 1), **self.fields)
+        message = [f'{self.label}:' if not final else f'{self.label} (done in {elapsed:.1f}s):']
+        if rows:
+            message.append(f'{rows:,} rows ({event["rows_per_sec"]:,.0f} rows/s)')
+        if nbytes:
+            message.append(f'{nbytes / 2 ** 20:,.1f} MiB ({event["bytes_per_sec"] / 2 ** 20:,.2f} MiB/s)')
+        message.extend(f'{k}: {v}' for k, v in self.fields.items())
+        self.logger.info(' '.join(message), extra=event)
+
+
 def load_config(config_path):
-    if isinstance(config_path, io.IOBase):
-        file = config_path
+    if isinstance(config_path, dict):
+        config = config_path
     else:
-        file = open(os.path.expanduser(config_path))
-    config = yaml.load(file)
+        if isinstance(config_path, io.IOBase):
+            file = config_path
+        else:
+            file = open(os.path.expanduser(config_path))
+        config = yaml.load(file)
     config_keys = {'credentials'}
     if config_keys - set(config.keys()):
         raise ValueError(f'Config keys missing: {config_keys - set(config.keys())}')
@@ -68,7 +230,7 @@ parse_ArrayOfMessageType = base_parser
 
 
 def parse_ArrayOfInstrument(resp):
-    arr = base_parser(resp)
+    arr = base_parser(resp) or []
     return [base_parser({k: v for k, v in instr.items() if v}) for instr in arr]
 
 
@@ -119,17 +281,25 @@ def make_TimeRange(param, factory):
 
 
 def make_RequestSpec(param, factory):
+    """
+    Generates RequestSpec from a (cached) YAML template path/name.
+    Returns a deep copy which can be freely modified (unlike `TemplateRegistry.clone`).
+    """
     if isinstance(param, CompoundValue):
         return param
     else:
-        return factory.RequestSpec(**yaml.load(open(param)))
+        return copy.deepcopy(TemplateRegistry.for_factory(factory).get(param, 'RequestSpec').obj)
 
 
 def make_LargeRequestSpec(param, factory):
+    """
+    Generates LargeRequestSpec from a (cached) YAML template path/name.
+    Returns a deep copy which can be freely modified (unlike `TemplateRegistry.clone`).
+    """
     if isinstance(param, CompoundValue):
         return param
     else:
-        return factory.LargeRequestSpec(**yaml.load(open(param)))
+        return copy.deepcopy(TemplateRegistry.for_factory(factory).get(param, 'LargeRequestSpec').obj)
 
 
 def parse_RequestResult(resp):
@@ -153,30 +323,15 @@ def parse_rid_type(x):
 def retry(func, *args, n=sys.maxsize, sleep=3, exp_base=1, exception_cls=Fault, **kwargs):
     """
     Retries calling wrapee function `n` times,
-    waiting `sleep * exp_base ** trial` between each trial.
+    waiting up to `sleep * exp_base ** trial` (full jitter) between each trial.
     Can be used as exception logger with n=1.
+    Kept for backwards compatibility: prefer `pytrthree.retry.RetryPolicy`.
 
     :param func: Wrapee function
     :param n: Maximum number of retries allowed. Defaults to 2^63 - 1.
     :param sleep: Multiplier of the exponential delayer
     :param exp_base: Base of the exponential delayer. Defaults to 1 (=constant delay).
     """
-
-    def retry_processing(trial, e, args, kwargs):
-        if trial < n - 1:
-            delay = sleep * exp_base ** trial
-            logger.info(f'Retrying in {delay} seconds (#{trial+1})...')
-            time.sleep(delay)
-        else:
-            raise e
-
-    def wrapper(func, *args, **kwargs):
-        for trial in range(n):
-            try:
-                return func(*args, **kwargs)
-            except exception_cls as e:
-                logger.error(e)
-                retry_processing(trial, e, args, kwargs)
-        return wrapper
-
-    return wrapper(func, *args, **kwargs)
+    policy = RetryPolicy(max_attempts=n, base=sleep, multiplier=exp_base, cap=None, deadline=None,
+                         retry_on=(exception_cls,), fatal=(), breaker=False)
+    return policy.call(func, *args, **kwargs)
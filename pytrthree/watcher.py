@@ -0,0 +1,249 @@
+"""
+Landing-zone watcher ingesting TRTH parts as soon as they have been fully delivered.
+
+Parts pushed by FTP requests (`delivery: Push`) arrive over hours. A file is considered
+complete when it was renamed into the directory or closed after writing (inotify only,
+requires the optional `inotify_simple` package) or when its size and modification time
+have not changed for `settle` seconds (polling fallback). Hidden files and temporary
+upload names (e.g. `*.part`, `*.tmp`) are ignored until they are renamed.
+
+Requests are tracked by request ID: once the report file of a request has arrived and
+all of its data parts have been ingested, the request is considered delivered and can
+optionally be cancelled (cleaned up) on the TRTH server. Parts whose ingestion fails are
+retried with exponential backoff; a request with a part that failed `max_attempts` times
+is never delivered.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from . import utils
+from .gzindex import RICIndex
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+logger = logging.getLogger('pytrthree')
+
+TEMP_SUFFIXES = ('.tmp', '.part', '.partial', '.filepart', '.crdownload')
+
+
+def request_id(fname) -> str:
+    """Returns the full request ID (e.g. `user@domain.com-name-N123456789`) of a TRTH file name"""
+    fname = os.path.basename(fname)
+    match = re.match(r'(.*-N\d{9})(?:-\w*)?\.(?:csv|txt)', fname)
+    if match is None:
+        raise ValueError(f'Not a TRTH file name: {fname}')
+    return match.group(1)
+
+
+class Request:
+    """Delivery state of the files of a single request"""
+
+    def __init__(self, rid, request_id):
+        self.rid = rid
+        self.request_id = request_id
+        self.parts = {}
+        self.delivered = False
+
+    @property
+    def data_parts(self) -> list:
+        return [path for path, state in self.parts.items() if state['ftype'] not in {'confirmation', 'report'}]
+
+    @property
+    def failed(self) -> list:
+        """Data parts whose ingestion failed too many times"""
+        return [path for path in self.data_parts if self.parts[path]['failed']]
+
+    @property
+    def finished(self) -> bool:
+        """Whether the report has arrived and all data parts have either been ingested or failed"""
+        report = any(state['ftype'] == 'report' and state['ready'] for state in self.parts.values())
+        return report and all(state['ready'] for state in self.parts.values()) and \
+            all(self.parts[path]['ingested'] or self.parts[path]['failed'] for path in self.data_parts)
+
+    @property
+    def complete(self) -> bool:
+        """Whether the report has arrived and all data parts have been ingested"""
+        return self.finished and not self.failed
+
+
+class LandingZoneWatcher:
+    """
+    Watches a directory and calls `ingest` on every complete TRTH data part
+    (confirmation and report files are tracked but not ingested).
+    """
+
+    def __init__(self, directory, ingest: Callable[[str], object], settle=30, poll_interval=5,
+                 api=None, cancel=False, journal=None, use_inotify=True, max_attempts=3, retry_delay=60):
+        """
+        :param directory: FTP landing directory
+        :param ingest: Function called with the path of each complete part
+                       (e.g. inserting the output of a `TRTHIterator` into a database)
+        :param settle: Seconds a file's size/mtime must stay unchanged to be considered complete
+        :param poll_interval: Seconds between directory scans
+        :param api: `TRTH` instance (required if `cancel` is True)
+        :param cancel: Whether to call `cancel_request` once all parts of a request have arrived
+        :param journal: File where ingested parts are recorded, so that they are skipped after a restart
+        :param use_inotify: Whether to use inotify (if available) instead of polling only
+        :param max_attempts: Maximum number of times `ingest` is called for a part
+        :param retry_delay: Seconds before the first retry of a failed part (doubled after each failure)
+        """
+        if cancel and api is None:
+            raise ValueError('`api` is required to cancel requests')
+        self.directory = os.path.expanduser(directory)
+        self.ingest = ingest
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.api = api
+        self.cancel = cancel
+        self.journal = os.path.expanduser(journal) if journal else None
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.inotify = None
+        if use_inotify and inotify_simple is not None:
+            self.inotify = inotify_simple.INotify()
+            flags = inotify_simple.flags
+            self.inotify.add_watch(self.directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+        elif use_inotify:
+            logger.debug('inotify_simple is not installed: polling only')
+        self.requests: Dict[str, Request] = {}
+        self.closed = set()
+        self.ingested = set()
+        if self.journal and os.path.exists(self.journal):
+            with open(self.journal) as f:
+                self.ingested = {line.strip() for line in f if line.strip()}
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def is_candidate(fname) -> bool:
+        return not (fname.startswith('.') or fname.endswith(TEMP_SUFFIXES) or fname.endswith(RICIndex.SUFFIX))
+
+    def _request(self, fname) -> Optional[Request]:
+        try:
+            rid, _ = utils.parse_rid_type(fname)
+        except (IndexError, ValueError):
+            return None
+        if rid not in self.requests:
+            self.requests[rid] = Request(rid, request_id(fname))
+        return self.requests[rid]
+
+    def _read_events(self, timeout):
+        """Waits up to `timeout` seconds for files to be closed/renamed into the directory"""
+        if self.inotify is None:
+            self.stopped.wait(timeout)
+            return
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            if event.name and self.is_candidate(event.name):
+                self.closed.add(event.name)
+
+    def scan(self) -> list:
+        """
+        Updates the state of all files in the directory.
+        :return: Paths of data parts that became complete since the last scan
+        """
+        now = time.time()
+        ready = []
+        for entry in os.scandir(self.directory):
+            if not self.is_candidate(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Moved/removed since listing the directory
+                continue
+            request = self._request(entry.name)
+            if request is None:
+                continue
+            ftype = utils.parse_rid_type(entry.name)[1]
+            state = request.parts.setdefault(entry.path, dict(key=None, since=now, ready=False, ftype=ftype,
+                                                              ingested=False, failed=False, attempts=0,
+                                                              retry_at=0))
+            key = (stat.st_size, stat.st_mtime)
+            if key != state['key']:
+                # New or re-delivered file
+                state.update(key=key, since=now, ready=False, failed=False, attempts=0, retry_at=0)
+            if state['ready'] or state['retry_at'] > now:
+                continue
+            closed = entry.name in self.closed
+            settled = max(now - state['since'], now - stat.st_mtime) >= self.settle
+            if stat.st_size and (closed or settled):
+                self.closed.discard(entry.name)
+                state['ready'] = True
+                if ftype not in {'confirmation', 'report'}:
+                    ready.append(entry.path)
+        return sorted(ready)
+
+    def _ingest(self, path):
+        state = self._request(os.path.basename(path)).parts[path]
+        if path in self.ingested:
+            logger.debug(f'Already ingested: {path}')
+            state['ingested'] = True
+            return
+        logger.info(f'Ingesting {os.path.basename(path)}')
+        state['attempts'] += 1
+        try:
+            self.ingest(path)
+        except Exception:
+            logger.exception(f'Failed to ingest {path} (attempt {state["attempts"]}/{self.max_attempts})')
+            if state['attempts'] >= self.max_attempts:
+                state['failed'] = True
+                logger.error(f'Giving up on {path}: {request_id(path)} will not be delivered')
+            else:
+                # Picked up again by `scan` once the delay has elapsed
+                delay = self.retry_delay * 2 ** (state['attempts'] - 1)
+                state.update(ready=False, retry_at=time.time() + delay)
+            return
+        state['ingested'] = True
+        self.ingested.add(path)
+        if self.journal:
+            with open(self.journal, 'a') as f:
+                f.write(path + '\n')
+
+    def _deliver(self, request: Request):
+        request.delivered = True
+        logger.info(f'All {len(request.data_parts)} parts of {request.request_id} have arrived')
+        if self.cancel:
+            logger.info(f'Canceling {request.request_id}')
+            self.api.cancel_request(requestID=request.request_id)
+
+    def poll(self, timeout=0):
+        """Waits for events (up to `timeout` seconds), then ingests complete parts"""
+        self._read_events(timeout)
+        for path in self.scan():
+            self._ingest(path)
+        for request in self.requests.values():
+            if request.complete and not request.delivered:
+                self._deliver(request)
+
+    def run(self, until_delivered=False):
+        """
+        Watches the directory until `stop` is called.
+        :param until_delivered: Return once all requests seen so far have been delivered.
+                                Raises `RuntimeError` if a request can't be delivered because
+                                some of its parts failed to be ingested.
+        """
+        logger.info(f'Watching {self.directory} ({"inotify" if self.inotify else "polling"})')
+        while not self.stopped.is_set():
+            self.poll(self.poll_interval)
+            requests = self.requests.values()
+            if until_delivered and requests and all(r.delivered or r.finished for r in requests):
+                failed = [path for r in requests for path in r.failed]
+                if failed:
+                    raise RuntimeError(f'Failed to ingest {len(failed)} parts: {failed}')
+                break
+
+    def stop(self):
+        self.stopped.set()
+
+    def close(self):
+        self.stop()
+        if self.inotify is not None:
+            self.inotify.close()
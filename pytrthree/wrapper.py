@@ -1,41 +1,89 @@
 import re
+import contextlib
+import contextvars
 import functools
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import partialmethod as pm
-from typing import Optional
+from typing import Iterable, Optional
 
+import requests
 from lxml import etree
 from zeep import Client, Plugin
 from zeep.exceptions import Fault
 from zeep.helpers import serialize_object
+from zeep.transports import Transport
 
 from . import utils
+from .retry import RETRYABLE_EXCEPTIONS, CircuitOpenError, RetryPolicy
+from .templates import TemplateRegistry
 
 
 class TRTH:
-    """A Pythonic wrapper for the TRTH API based on Zeep."""
+    """
+    A Pythonic wrapper for the TRTH API based on Zeep.
+
+    A single instance can be shared by multiple threads/coroutines: `self.options` holds
+    the defaults, which can be overridden per context (`override`) or per call (`_options`).
+    """
 
     TRTH_VERSION = '5.8'
     TRTH_WSDL_URL = f'https://trth-api.thomsonreuters.com/TRTHApi-{TRTH_VERSION}/wsdl/TRTHApi.wsdl'
+    # Functions which must not be repeated after a transport error (see `RetryPolicy.non_idempotent`)
+    NON_IDEMPOTENT = {'SubmitRequest', 'SubmitFTPRequest'}
 
     def __init__(self, config=None):
         self.config = utils.load_config(config)
         self.logger = utils.make_logger('pytrthree', self.config)
         self.options = dict(debug=False, target_cls=dict, raise_exception=False,
-                            input_parser=True, output_parser=True)
+                            input_parser=True, output_parser=True,
+                            retry=RetryPolicy.from_config(self.config.get('retry')))
+        self._local_options = contextvars.ContextVar(f'trth_options_{id(self)}', default={})
+        self.pool_size = self.config.get('pool_size', 10)
         self.plugin = DebugPlugin(self)
-        self.client = Client(self.TRTH_WSDL_URL, strict=True, plugins=[self.plugin])
+        wsdl = self.config.get('wsdl', self.TRTH_WSDL_URL)
+        self.client = Client(wsdl, strict=True, plugins=[self.plugin], transport=self._make_transport())
         self.factory = self.client.type_factory('ns0')
+        self.templates = TemplateRegistry.for_factory(self.factory)
         self.signatures = self._parse_signatures()
         self._make_docstring()
         self.client.set_default_soapheaders(self._make_header())
         self.logger.info('TRTH API initialized.')
 
     def __getattr__(self, item):
+        options = self.__dict__.get('options', {})
+        if item not in options:
+            raise AttributeError(item)
+        return self._local_options.get().get(item, options[item])
+
+    def __setattr__(self, key, value):
+        if key in self.__dict__.get('options', {}):
+            self.options[key] = value
+        else:
+            super().__setattr__(key, value)
+
+    @contextlib.contextmanager
+    def override(self, **options):
+        """
+        Overrides options for the current thread/coroutine only.
+        Usage: `with api.override(raise_exception=True): api.get_quota()`
+        """
+        unknown = set(options) - set(self.options)
+        if unknown:
+            raise ValueError(f'Invalid options: {unknown}')
+        token = self._local_options.set({**self._local_options.get(), **options})
         try:
-            return self.__dict__[item]
-        except KeyError:
-            return self.options[item]
+            yield self
+        finally:
+            self._local_options.reset(token)
+
+    def _make_transport(self):
+        """Makes a Zeep transport whose connection pool can hold one connection per thread"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return Transport(session=session)
 
     def _parse_signatures(self):
         """Parses API functions signature from WSDL document"""
@@ -71,6 +119,8 @@ class TRTH:
             if isinstance(obj, functools.partial):
                 new_obj = functools.update_wrapper(obj, self._wrap)
                 func = obj.keywords['function']
+                if func not in self.signatures:
+                    continue
                 new_obj.signature, new_obj.__doc__ = formatter(func)
                 setattr(self, attr, new_obj)
 
@@ -91,29 +141,74 @@ class TRTH:
         self.logger.info(f'Token ID: {response.header.CredentialsHeader.tokenId}')
         return header
 
-    def _wrap(self, *args, function=None, **kwargs) -> Optional[dict]:
+    def _wrap(self, *args, function=None, _options=None, **kwargs) -> Optional[dict]:
         """
         Wrapper for TRTH API functions.
         :param function: Wrapped TRTH API function string name
+        :param _options: Option overrides for this call only
         :param args: API function arguments
         :param kwargs: API function arguments
         """
         if function is None:
             raise ValueError('API function not specified')
+        if _options:
+            with self.override(**_options):
+                return self._wrap(*args, function=function, **kwargs)
         if self.debug:
             print(self.signatures[function])
         input_type, output_type = self.signatures[function]
         params = self._parse_params(args, kwargs, input_type)
         try:
             f = getattr(self.client.service, function)
-            resp = f(**params)
+            retry = self.retry
+            if retry and function in self.NON_IDEMPOTENT:
+                retry = retry.non_idempotent()
+            resp = retry.call(f, **params) if retry else f(**params)
             return self._parse_response(resp, output_type)
-        except Fault as fault:
+        except (CircuitOpenError,) + RETRYABLE_EXCEPTIONS as fault:
+            # Faults, transport errors and open circuits (once retries are exhausted)
             if self.raise_exception:
                 raise fault
             else:
                 self.logger.error(fault)
 
+    def map(self, function, params: Iterable, max_workers=None, return_exceptions=False, **options) -> list:
+        """
+        Calls an API function once per item of `params` using a bounded thread pool.
+        All calls share this client (and its HTTP connection pool).
+        :param function: API function name (e.g. 'expand_chain') or wrapped method
+        :param params: Iterable of arguments. Dictionaries are passed as keyword arguments,
+                       tuples as positional arguments and anything else as a single argument.
+        :param max_workers: Number of threads. Defaults to `self.pool_size`.
+        :param return_exceptions: Whether to return raised exceptions in place of results
+        :param options: Option overrides applied to every call (e.g. `raise_exception=True`)
+        :return: List of results in the same order as `params`
+        """
+        func = getattr(self, function) if isinstance(function, str) else function
+        options = {**self._local_options.get(), **options}
+
+        def call(param):
+            if isinstance(param, dict):
+                return func(_options=options, **param)
+            elif isinstance(param, tuple):
+                return func(*param, _options=options)
+            else:
+                return func(param, _options=options)
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            futures = [executor.submit(call, param) for param in params]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    if not return_exceptions:
+                        for f in futures:
+                            f.cancel()
+                        raise
+                    results.append(e)
+        return results
+
     def _parse_params(self, args, kwargs, input_type):
         """
         Uses util parser functions so that the user doesn't have to manually instanciate
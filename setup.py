@@ -3,8 +3,8 @@ import sys
 from setuptools import setup
 from setuptools.command.install import install
 
-if sys.version_info.major != 3:
-    sys.exit('Support Python 3 only')
+if sys.version_info < (3, 7):
+    sys.exit('Support Python 3.7+ only')
 
 
 class Installer(install):
@@ -22,13 +22,16 @@ setup(name='pytrthree',
       author_email='gusutabopb@gmail.com',
       url='https://github.com/plugaai/pytrthree',
       packages=['pytrthree'],
+      package_data={'pytrthree': ['request_templates/*.yml']},
       license='GPL',
+      python_requires='>=3.7',
       install_requires=['zeep', 'pytest', 'pandas', 'pyyaml', 'numpy'],
+      extras_require={'index': ['indexed_gzip'], 'watch': ['inotify_simple'], 'zstd': ['zstandard']},
       classifiers=[
           'Intended Audience :: Developers',
           'Intended Audience :: Science/Research',
           'Intended Audience :: Financial and Insurance Industry',
           'Development Status :: 3 - Alpha',
-          'Programming Language :: Python :: 3.6'
+          'Programming Language :: Python :: 3.7',
           "Topic :: Software Development :: Libraries",
       ])
@@ -1,6 +1,13 @@
+import gzip
+import os
+import random
+
 import pytest
 
 from pytrthree import TRTH
+from pytrthree.mockserver import MockTRTH, make_config
+
+MOCK_WSDL = os.path.join(os.path.dirname(__file__), 'data', 'TRTHApi.wsdl')
 
 
 def pytest_addoption(parser):
@@ -10,9 +17,54 @@ def pytest_addoption(parser):
 @pytest.fixture(scope="module")
 def api(request):
     config = request.config.getoption("--config")
+    if config is None:
+        pytest.skip('--config not given (tests require access to the TRTH API)')
     print(f'Config file: {config}')
     api = TRTH(config=config)
     api.debug = True
     api.options['raise_exception'] = True
     assert api.debug
     yield api
+
+
+@pytest.fixture(scope="module")
+def mock_server():
+    with MockTRTH(MOCK_WSDL, rows=100, seed=0) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def mock_api(mock_server, tmpdir_factory):
+    api = TRTH(config=make_config(mock_server, log=str(tmpdir_factory.mktemp('log'))))
+    api.options['raise_exception'] = True
+    yield api
+
+
+HEADER = '#RIC,Date[G],Time[G],GMT Offset,Type,Price,Volume'
+
+
+def make_rows(rics=('7203.T', '9984.T'), n=2000, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for ric in rics:
+        for i in range(n):
+            s = i * 7
+            rows.append(f'{ric},20160412,{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}.{i:06d},9,'
+                        f'Trade,{1000 + rng.randint(-5, 5)},{rng.randint(1, 9) * 100}')
+    return rows
+
+
+def write_csv(path, rows):
+    with gzip.open(path, 'wt') as f:
+        f.write('\n'.join([HEADER] + rows) + '\n')
+    return path
+
+
+def write_part(tmpdir, rows, part=0):
+    return write_csv(str(tmpdir.join(f'user-test-N123456789-part{part:03d}.csv.gz')), rows)
+
+
+@pytest.fixture
+def parts(tmpdir):
+    rows = make_rows()
+    return [write_part(tmpdir, rows[:2500], 0), write_part(tmpdir, rows[2500:], 1)]
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from pytrthree import TRTHIterator
+from pytrthree.coordinator import WorkQueue, Worker
+
+
+def touch(tmpdir, name):
+    path = tmpdir.join(name)
+    path.write('x' * 10)
+    return str(path)
+
+
+@pytest.fixture
+def files(tmpdir):
+    names = [f'user-a-N00000000{i}-part00{j}.csv.gz' for i in range(1, 3) for j in range(3)]
+    names += ['user-a-N000000001-report.csv', 'user-a-N000000001-confirmation.csv', 'notes.txt']
+    return [touch(tmpdir, name) for name in names]
+
+
+def test_add_and_lease(tmpdir, files):
+    queue = WorkQueue(str(tmpdir.join('queue.db')))
+    assert queue.add(files) == 6
+    assert queue.add(files) == 0
+    for worker in ['w1', 'w2']:
+        queue.register(worker)
+    leased = [queue.acquire(f'w{i % 2 + 1}') for i in range(6)]
+    assert len({(u.rid, u.part) for u in leased}) == 6
+    assert queue.acquire('w1') is None
+    for i, unit in enumerate(leased):
+        assert queue.complete(f'w{i % 2 + 1}', unit, rows=100, seconds=0.5)
+    assert queue.progress() == {'done': 6}
+    stats = queue.stats()
+    assert stats.loc['w1', 'units'] == 3 and stats.loc['w2', 'rows'] == 300
+    assert stats.loc['w1', 'rows_per_sec'] == 200 and stats['alive'].all()
+
+
+def test_lease_expiry(tmpdir, files):
+    queue = WorkQueue(str(tmpdir.join('queue.db')), lease_time=0.2, max_attempts=2)
+    queue.add(files[:1])
+    crashed = queue.acquire('crashed')
+    assert queue.acquire('w1') is None
+    time.sleep(0.3)
+    unit = queue.acquire('w1')
+    assert (unit.rid, unit.part, unit.attempts) == (crashed.rid, crashed.part, 2)
+    assert not queue.complete('crashed', crashed, rows=1, seconds=1)
+    assert not queue.heartbeat('crashed', crashed)
+    assert queue.heartbeat('w1', unit)
+    queue.fail('w1', unit, 'error')
+    assert queue.progress() == {'failed': 1}
+    queue.reset()
+    assert queue.progress() == {'pending': 1}
+
+
+def test_lease_expiry_max_attempts(tmpdir, files):
+    queue = WorkQueue(str(tmpdir.join('queue.db')), lease_time=0.05, max_attempts=2)
+    queue.add(files[:1])
+    assert queue.acquire('w1').attempts == 1
+    time.sleep(0.1)
+    assert queue.acquire('w2').attempts == 2
+    time.sleep(0.1)
+    assert queue.acquire('w3') is None
+    assert queue.progress() == {'failed': 1}
+    assert queue.units()['error'][0] == 'Lease expired after 2 attempts'
+
+
+def test_workers(tmpdir, parts):
+    queue = WorkQueue(str(tmpdir.join('queue.db')), lease_time=1)
+    queue.add(parts)
+
+    def ingest(unit, lost):
+        time.sleep(0.4)  # Longer than the heartbeat interval
+        return sum(len(df) for _, df in TRTHIterator(unit.path))
+
+    workers = [Worker(queue, f'w{i}') for i in range(3)]
+    threads = [threading.Thread(target=w.run, args=(ingest,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert queue.progress() == {'done': 2}
+    assert queue.stats()['rows'].sum() == 4000
+
+
+def test_lost_lease(tmpdir, files):
+    queue = WorkQueue(str(tmpdir.join('queue.db')), lease_time=0.3)
+    queue.add(files[:1])
+    worker = Worker(queue, 'w1', heartbeat=0.05)
+    seen = []
+
+    def ingest(unit, lost):
+        if not seen:
+            queue.reset(states=('leased',))  # Reassigned while processing
+            seen.append(lost.wait(1))
+        else:
+            seen.append(lost.is_set())
+        return 1
+
+    completed = worker.run(ingest)
+    assert seen == [True, False]
+    assert len(completed) == 1  # Completed by its second lease only
+    assert queue.progress() == {'done': 1}
@@ -0,0 +1,106 @@
+import gzip
+
+import pandas as pd
+import pytest
+
+from pytrthree import TRTHIterator, gzindex
+from pytrthree.gzindex import RICIndex
+from pytrthree.transcode import ZstdPart
+
+from .conftest import make_rows, write_part
+
+def collect(iterator):
+    output = {}
+    for ric, df in iterator:
+        output.setdefault(ric, []).append(df)
+    return {ric: pd.concat(dfs) for ric, dfs in output.items()}
+
+
+@pytest.mark.parametrize('by, freq', [('time', '15min'), ('volume', 10000), ('tick', 100)])
+def test_bars_across_chunks_and_files(parts, by, freq):
+    expected = collect(TRTHIterator(parts, chunksize=10 ** 6).bars(freq, by=by))
+    result = collect(TRTHIterator(parts, chunksize=333).bars(freq, by=by))
+    assert set(result) == {'7203.T', '9984.T'}
+    for ric, bars in result.items():
+        pd.testing.assert_frame_equal(bars, expected[ric])
+        assert bars.index.is_monotonic_increasing and bars.index.is_unique
+        assert bars['ticks'].sum() == 2000
+
+
+def test_time_bars_match_resample(parts):
+    ticks = collect(TRTHIterator(parts))
+    bars = collect(TRTHIterator(parts, chunksize=333).bars('15min'))
+    for ric, df in ticks.items():
+        ohlc = df['Price'].resample('15min').ohlc().dropna()
+        assert (bars[ric][['open', 'high', 'low', 'close']].values == ohlc.values).all()
+        vwap = (df['Price'] * df['Volume']).resample('15min').sum() / df['Volume'].resample('15min').sum()
+        assert (bars[ric]['vwap'] - vwap.dropna()).abs().max() < 1e-9
+
+
+@pytest.mark.parametrize('zran', [True, False])
+def test_ric_index(parts, monkeypatch, zran):
+    if not zran:
+        monkeypatch.setattr(gzindex, 'indexed_gzip', None)
+    assert RICIndex.load(parts[0]) is None
+    index = RICIndex.build(parts[0])
+    assert list(index.rics) == ['7203.T', '9984.T']
+    assert index.rics['9984.T'][2:] == (2000, 2500)
+    assert (RICIndex.load(parts[0]).access_points is not None) == zran
+
+    expected = collect(TRTHIterator(parts[0]))['9984.T']
+    result = collect(TRTHIterator(parts + [RICIndex.sidecar(parts[0])], rics=['9984.T']))
+    assert list(result) == ['9984.T']
+    pd.testing.assert_frame_equal(result['9984.T'].iloc[:len(expected)], expected)
+    assert len(result['9984.T']) == 2000
+
+    with gzip.open(parts[0], 'at') as f:
+        f.write('9999.T,20160412,00:00:00.000000,9,Trade,1,100\n')
+    assert RICIndex.load(parts[0]) is None
+    RICIndex.get(parts[0], build=True)
+    assert RICIndex.load(parts[0]) is not None
+
+
+def test_transcode(parts):
+    pytest.importorskip('zstandard')
+    expected = collect(TRTHIterator(parts, transcoded=False))
+    transcoded = [ZstdPart.transcode(path, frame_size=2 ** 12, threads=2) for path in parts]
+    assert [part.rows for part in transcoded] == [2500, 1500]
+    assert len(transcoded[0].frames) > 1 and transcoded[0].frames[0][4] == ['7203.T']
+
+    # Transcoded parts are picked up from either the source or the .zst file name, but read only once
+    for files in [parts, [p.path for p in transcoded], parts + [p.path for p in transcoded]]:
+        result = collect(TRTHIterator(files, chunksize=333))
+        for ric, df in expected.items():
+            pd.testing.assert_frame_equal(result[ric], df)
+    with transcoded[0].open(threads=1) as f:  # Closed before reading all frames
+        assert f.readline() == transcoded[0].header
+    frames = transcoded[0].select(['9984.T'])
+    assert 0 < len(frames) < len(transcoded[0].frames)
+    result = collect(TRTHIterator(parts, rics=['9984.T']))
+    pd.testing.assert_frame_equal(result['9984.T'], expected['9984.T'])
+
+    # Corrupted index
+    transcoded[1].source['rows'] += 1
+    with open(transcoded[1].path, 'r+b') as f:
+        f.truncate(sum(transcoded[1].frames[-1][:2]))
+        f.seek(0, 2)
+        transcoded[1]._write_index(f)
+    with pytest.raises(ValueError):
+        collect(TRTHIterator(transcoded[1].path))
+    with pytest.raises(ValueError):
+        transcoded[1].verify()
+    # Frame row counts are checked as frames are decompressed
+    transcoded[0].frames[1][3] += 1
+    transcoded[0].source['rows'] += 1
+    with open(transcoded[0].path, 'r+b') as f:
+        f.truncate(sum(transcoded[0].frames[-1][:2]))
+        f.seek(0, 2)
+        transcoded[0]._write_index(f)
+    with pytest.raises(ValueError, match='frame at offset'):
+        collect(TRTHIterator(transcoded[0].path))
+
+    # Stale transcoded parts are ignored
+    with gzip.open(parts[1], 'at') as f:
+        f.write('9999.T,20160412,00:00:00.000000,9,Trade,1,100\n')
+    assert ZstdPart.get(parts[1]) is None and ZstdPart.get(transcoded[1].path) is None
+    assert len(collect(TRTHIterator(parts[1]))['9999.T']) == 1
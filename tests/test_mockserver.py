@@ -0,0 +1,55 @@
+import pytest
+import requests
+from zeep.exceptions import Fault
+
+from pytrthree import TRTH
+from pytrthree.mockserver import MockTRTH, make_config
+from .conftest import MOCK_WSDL
+
+
+def test_instrument_details(mock_api):
+    criteria = dict(RICRegex=r'^720[0-9]{1}\.T$')
+    resp = mock_api.search_rics(criteria=criteria, refData=False)
+    assert resp and all(ric.startswith('720') for ric in resp)
+    resp = mock_api.expand_chain('0#.N225', requestInGMT=True)
+    assert resp[0] == '.N225'
+
+
+def test_direct_request(mock_api, mock_server):
+    request = mock_api.factory.RequestSpec(friendlyName='mock', instrument={'code': '7203.T'},
+                                           date='2016-04-12')
+    rid = mock_api.submit_request(request)
+    assert mock_api.get_status()['status']['total'] >= 1
+    df = mock_api.get_request_result(**rid)
+    assert len(df) == mock_server.rows
+    assert set(df['#RIC']) == {'7203.T'}
+    mock_api.clean_up()
+    assert mock_api.get_status()['status']['total'] == 0
+
+
+def test_throttling(tmpdir):
+    with MockTRTH(MOCK_WSDL, rate_limit=2, seed=0) as server:
+        api = TRTH(config=make_config(server, log=str(tmpdir)))
+        api.options['raise_exception'] = True
+        with pytest.raises(Fault) as excinfo:
+            for _ in range(10):
+                api.get_status()
+        assert excinfo.value.message == MockTRTH.THROTTLE_MESSAGE
+        assert server.stats()['faults']['GetInflightStatus'] >= 1
+
+
+def test_unexpected_errors(mock_api, mock_server):
+    envelope = ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+                'xmlns:ns0="http://webservices.thomsonreuters.com/TRTHApi"><soap:Body>'
+                '<ns0:GetInflightStatus/></soap:Body></soap:Envelope>')
+    resp = requests.post(mock_server.url, data=envelope, headers={'Content-Type': 'text/xml'})
+    assert resp.status_code == 500 and b'Invalid token' in resp.content
+
+    handler = mock_server.handlers['GetInflightStatus']
+    mock_server.handlers['GetInflightStatus'] = lambda **kwargs: 1 / 0
+    try:
+        with pytest.raises(Fault) as excinfo:
+            mock_api.get_status()
+        assert 'ZeroDivisionError' in excinfo.value.message and excinfo.value.code == 'soap:Server'
+    finally:
+        mock_server.handlers['GetInflightStatus'] = handler
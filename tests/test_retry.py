@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+import requests
+import urllib3
+from zeep.exceptions import Fault
+
+from pytrthree import TRTH
+from pytrthree.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from pytrthree.mockserver import MockTRTH, make_config
+
+from .conftest import MOCK_WSDL
+
+
+class Flaky:
+    def __init__(self, failures, message=MockTRTH.THROTTLE_MESSAGE):
+        self.failures = failures
+        self.message = message
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Fault(self.message)
+        return self.calls
+
+
+def test_backoff_full_jitter():
+    policy = RetryPolicy(base=1, multiplier=2, cap=5, seed=0)
+    delays = [policy.backoff(attempt) for attempt in range(10) for _ in range(50)]
+    assert all(0 <= d <= 5 for d in delays)
+    assert len(set(delays)) == len(delays)
+
+
+def test_retry_and_fatal_faults():
+    policy = RetryPolicy(max_attempts=5, base=0.001, breaker=False)
+    func = Flaky(3)
+    assert policy.call(func) == 4
+
+    func = Flaky(3, message='Invalid token. Please authenticate first.')
+    with pytest.raises(Fault):
+        policy.call(func)
+    assert func.calls == 1
+
+    func = Flaky(10)
+    with pytest.raises(Fault):
+        policy.call(func)
+    assert func.calls == 5
+
+
+def test_deadline():
+    policy = RetryPolicy(max_attempts=100, base=10, cap=10, deadline=0.01, breaker=False, seed=1)
+    func = Flaky(10)
+    with pytest.raises(Fault):
+        policy.call(func)
+    assert func.calls < 10
+
+
+def test_shared_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+    policy = RetryPolicy(max_attempts=2, base=0.001, deadline=1, breaker=breaker)
+    with pytest.raises(Fault):
+        policy.call(Flaky(10))
+    assert breaker.state == 'open'
+    other = Flaky(0)
+    with pytest.raises(CircuitOpenError):
+        policy.call(other)
+    assert other.calls == 0
+
+    breaker.opened_at -= 60
+    assert breaker.state == 'half-open'
+    assert policy.call(other) == 1
+    assert breaker.state == 'closed'
+
+
+def test_async():
+    policy = RetryPolicy(max_attempts=5, base=0.001, breaker=False)
+    func = Flaky(2)
+
+    @policy
+    async def coro():
+        return func()
+
+    assert asyncio.run(coro()) == 3
+
+
+def test_trth_option(mock_api, mock_server):
+    mock_server.fault_rate = 0.5
+    try:
+        mock_api.options['retry'] = RetryPolicy(max_attempts=20, base=0.001, breaker=False)
+        for _ in range(10):
+            assert mock_api.get_status()['status']
+    finally:
+        mock_server.fault_rate = 0
+        mock_api.options['retry'] = None
+
+
+def test_trth_open_circuit(tmpdir):
+    with MockTRTH(MOCK_WSDL, seed=0) as server:
+        api = TRTH(config=make_config(server, log=str(tmpdir)))
+        api.options['retry'] = RetryPolicy(max_attempts=2, base=0.001, deadline=5,
+                                           breaker=CircuitBreaker(2, 60))
+        server.fault_rate = 1
+        assert api.get_status() is None
+        assert api.retry.breaker.state == 'open'
+        assert api.get_status() is None
+        with pytest.raises(CircuitOpenError):
+            api.get_status(_options=dict(raise_exception=True))
+
+
+def test_non_idempotent():
+    policy = RetryPolicy(breaker=False)
+    unsafe = policy.non_idempotent()
+    read_timeout = requests.exceptions.ReadTimeout()
+    refused = requests.exceptions.ConnectionError(urllib3.exceptions.MaxRetryError(
+        None, '/', urllib3.exceptions.NewConnectionError(None, 'Connection refused')))
+    reset = requests.exceptions.ConnectionError(urllib3.exceptions.ProtocolError('Connection reset'))
+    assert all(policy.is_retryable(e) for e in [read_timeout, refused, reset])
+    assert not unsafe.is_retryable(read_timeout) and not unsafe.is_retryable(reset)
+    assert unsafe.is_retryable(refused) and unsafe.is_retryable(requests.exceptions.ConnectTimeout())
+    assert unsafe.is_retryable(Fault(MockTRTH.THROTTLE_MESSAGE))
+    assert policy.idempotent and unsafe.non_idempotent() is unsafe
+
+
+def test_non_idempotent_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+    unsafe = RetryPolicy(max_attempts=3, base=0.001, breaker=breaker).non_idempotent()
+
+    def timeout():
+        raise requests.exceptions.ReadTimeout()
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            unsafe.call(timeout)
+    assert breaker.state == 'open'
+
+    # A timed-out half-open probe keeps the circuit open
+    breaker.opened_at -= 60
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        unsafe.call(timeout)
+    assert breaker.state == 'open'
+    assert breaker.failures == 3
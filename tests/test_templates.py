@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pytest
+
+from pytrthree import utils
+from pytrthree.templates import TEMPLATE_DIR, TemplateRegistry
+
+
+@pytest.fixture
+def registry(mock_api, tmpdir):
+    for name in ('RequestSpec', 'LargeRequestSpec'):
+        shutil.copy(os.path.join(TEMPLATE_DIR, f'{name}.yml'), str(tmpdir))
+    return TemplateRegistry(mock_api.factory, directory=str(tmpdir))
+
+
+def test_cache(registry, tmpdir):
+    assert registry.names == ['LargeRequestSpec', 'RequestSpec']
+    template = registry.get('LargeRequestSpec')
+    assert template.type_name == 'LargeRequestSpec'
+    assert registry.get(template.path) is template
+
+    path = str(tmpdir.join('LargeRequestSpec.yml'))
+    with open(path, 'a') as f:
+        f.write('\nsplitSize: 100\n')
+    os.utime(path, (0, template.mtime + 1))
+    reloaded = registry.get('LargeRequestSpec')
+    assert reloaded is not template
+    assert reloaded.obj['splitSize'] == 100
+
+
+def test_clone(registry):
+    template = registry.get('LargeRequestSpec').obj
+    r1 = registry.clone('LargeRequestSpec', instruments=['7203.T'], fields=['Price'],
+                        dateRange=dict(start='2017-01-01', end='2017-01-31'))
+    r2 = registry.clone('LargeRequestSpec', **{'timeRange.start': '09:00'})
+    assert [i['code'] for i in r1['instrumentList']['instrument']] == ['7203.T']
+    assert r1['messageTypeList']['messageType'][0]['fieldList']['string'] == ['Price']
+    assert r2['timeRange']['start'] == '09:00'
+
+    # Template is untouched and unchanged subtrees are shared
+    assert [i['code'] for i in template['instrumentList']['instrument']] == ['7202.T', '7211.T']
+    assert template['messageTypeList']['messageType'][0]['fieldList']['string'] == ['Price', 'Volume']
+    assert template['timeRange']['start'] == '00:00'
+    assert r1['timeRange'] is template['timeRange']
+    assert r2['messageTypeList'] is template['messageTypeList']
+
+    r3 = registry.clone('RequestSpec', instruments='9984.T', dateRange=dict(start='2017-01-04'))
+    assert r3['instrument']['code'] == '9984.T' and r3['date'] == '2017-01-04'
+    with pytest.raises(TypeError):
+        registry.clone('LargeRequestSpec', foo=1)
+
+
+def test_submit_template(mock_api):
+    rid = mock_api.submit_request('RequestSpec')
+    assert '-simple_request-N' in rid['requestID']
+    rid = mock_api.submit_ftp_request(os.path.join(TEMPLATE_DIR, 'LargeRequestSpec.yml'))
+    assert '-tas_trade_template-N' in rid['requestID']
+
+
+def test_make_request_spec_is_mutable(mock_api):
+    template = mock_api.templates.get('RequestSpec').obj
+    code = template['instrument']['code']
+    request = utils.make_RequestSpec('RequestSpec', mock_api.factory)
+    request['instrument']['code'] = 'CHANGED'
+    request = utils.make_LargeRequestSpec('LargeRequestSpec', mock_api.factory)
+    request['instrumentList']['instrument'][0]['code'] = 'CHANGED'
+    assert template['instrument']['code'] == code
+    assert mock_api.templates.clone('LargeRequestSpec')['instrumentList']['instrument'][0]['code'] != 'CHANGED'
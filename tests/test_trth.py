@@ -1,11 +1,14 @@
 import functools
 import datetime
+import os
 import time
 import subprocess
 
 import pytest
 from zeep.exceptions import Fault
 
+from pytrthree.templates import TEMPLATE_DIR
+
 
 sprint = functools.partial(print, end='\n=====\n')
 
@@ -36,7 +39,7 @@ def test_instrument_details(api):
 
 
 def test_direct_request(api):
-    r = '../templates/RequestSpec.yml'
+    r = os.path.join(TEMPLATE_DIR, 'RequestSpec.yml')
     rid = api.submit_request(r)
     while True:
         if api.get_status()['status']['active']:
@@ -57,7 +60,7 @@ def test_direct_request(api):
 def test_ftp_request(api):
     api.set_ftp_details(**api.config['ftp'])
     api.test_ftp()
-    r = '../templates/LargeRequestSpec.yml'
+    r = os.path.join(TEMPLATE_DIR, 'LargeRequestSpec.yml')
     rid1 = api.submit_ftp_request(r)
     rid2 = api.submit_ftp_request(r)
     sprint(rid1, rid2, sep='\n')
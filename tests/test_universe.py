@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+from zeep.exceptions import Fault
+
+from pytrthree import TRTH
+from pytrthree.mockserver import make_config
+from pytrthree.universe import DayCache, expand_chains, make_spans, resolve_symbology
+
+
+def test_make_spans():
+    days = [datetime.date(2017, 1, d) for d in (1, 2, 3, 5, 7, 8)]
+    assert make_spans(days) == [(days[0], days[2]), (days[3], days[3]), (days[4], days[5])]
+
+
+def test_expand_chains(mock_api, mock_server):
+    cache = DayCache()
+    chains = ['0#.N225', '0#.TOPX', '0#.N225']
+    resp = expand_chains(mock_api, chains, dict(start='2017-01-01', end='2017-01-05'), cache=cache)
+    assert list(resp) == ['0#.N225', '0#.TOPX']
+    assert '.N225' in resp['0#.N225']
+    assert len(cache) == 10
+
+    calls = mock_server.stats()['calls']['ExpandChain']
+    resp = expand_chains(mock_api, chains, dict(start='2017-01-04', end='2017-01-06'),
+                         cache=cache, by_day=True)
+    assert mock_server.stats()['calls']['ExpandChain'] == calls + 2
+    assert len(resp['0#.TOPX']) == 3
+
+
+def test_expand_chains_faults(mock_api, mock_server):
+    cache = DayCache()
+    mock_server.fault_rate = 1
+    try:
+        with mock_api.override(raise_exception=False), pytest.raises(Fault):
+            expand_chains(mock_api, ['0#.N225'], dict(start='2017-01-01', end='2017-01-02'), cache=cache)
+    finally:
+        mock_server.fault_rate = 0
+    assert len(cache) == 0
+
+
+def test_resolve_symbology(mock_api, mock_server, tmpdir):
+    mock_server.renames['ABC.T'] = ('XYZ.T', '2017-01-03')
+    path = str(tmpdir.join('symbology'))
+    with DayCache(path) as cache:
+        resp = resolve_symbology(mock_api, ['ABC.T', 'DEF.T'], dict(start='2017-01-01', end='2017-01-02'),
+                                 cache=cache)
+        assert resp == {'ABC.T': [], 'DEF.T': []}
+
+    calls = mock_server.stats()['calls']['GetRICSymbology']
+    with DayCache(path) as cache:
+        resp = resolve_symbology(mock_api, ['ABC.T', 'DEF.T'], dict(start='2017-01-01', end='2017-01-10'),
+                                 cache=cache)
+        assert [r['newCode'] for r in resp['ABC.T']] == ['XYZ.T']
+        assert resp['DEF.T'] == []
+    assert mock_server.stats()['calls']['GetRICSymbology'] == calls + 2
+
+
+def test_default_cache(mock_api, mock_server):
+    other = TRTH(config=make_config(mock_server))
+    assert DayCache.for_api(mock_api) is DayCache.for_api(mock_api)
+    assert DayCache.for_api(mock_api) is not DayCache.for_api(other)
+
+    calls = mock_server.stats()['calls']['ExpandChain']
+    for api in [mock_api, mock_api, other]:
+        expand_chains(api, ['0#.JNI'], dict(start='2017-02-01', end='2017-02-01'))
+    assert mock_server.stats()['calls']['ExpandChain'] == calls + 2  # Not shared across clients
@@ -0,0 +1,67 @@
+import json
+import logging
+
+from pytrthree import TRTH, utils
+from pytrthree.mockserver import make_config
+
+
+def test_log_options():
+    assert utils.log_options()['path']
+    assert utils.log_options({'log': '/tmp/logs'})['path'] == '/tmp/logs'
+    options = utils.log_options({'log': {'format': 'json', 'progress_interval': 1}})
+    assert options['format'] == 'json' and options['progress_interval'] == 1 and options['queue']
+
+
+def test_queued_json_logger(tmpdir):
+    logger = utils.make_logger('pytrthree_test', {'log': {'path': str(tmpdir), 'format': 'json'}})
+    assert isinstance(logger.handlers[0], logging.handlers.QueueHandler)
+    logger.info('hello', extra={'rows': 10})
+    utils.flush_logger('pytrthree_test')
+    with open(tmpdir.join('pytrthree_test.log')) as f:
+        record = json.loads(f.readline())
+    assert record['message'] == 'hello' and record['level'] == 'INFO' and record['rows'] == 10
+    utils._remove_handlers(logger)
+    assert 'pytrthree_test' not in utils._log_listeners and not logger.handlers
+    utils.flush_logger('pytrthree_test')  # No-op once stopped
+
+
+def test_trth_log_config(tmpdir, mock_server):
+    logger = utils.make_logger('pytrthree')  # Made with default options when importing pytrthree
+    config = make_config(mock_server)
+    config['log'] = {'path': str(tmpdir), 'format': 'json', 'console_level': 'WARNING'}
+    api = TRTH(config=config)
+    assert api.logger is logger and utils._log_options['pytrthree']['format'] == 'json'
+    api.logger.info('hello', extra={'rows': 10})
+    utils.flush_logger('pytrthree')
+    with open(tmpdir.join('pytrthree.log')) as f:
+        records = [json.loads(line) for line in f]
+    assert records[-1]['message'] == 'hello' and records[-1]['rows'] == 10
+    assert utils.make_logger('pytrthree') is logger and len(logger.handlers) == 1
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_progress_rate_limit():
+    logger = logging.getLogger('pytrthree_progress')
+    handler = Records()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    with utils.Progress(logger, 'file', interval=60) as progress:
+        for _ in range(100):
+            progress.update(rows=10, bytes=100)
+    assert len(handler.records) == 1
+    record = handler.records[0]
+    assert record.final and record.rows == 1000 and record.bytes == 10000 and record.rows_per_sec > 0
+
+    handler.records.clear()
+    progress = utils.Progress(logger, 'file', interval=0)
+    progress.update(rows=1)
+    progress.update(rows=1, completed=1)
+    assert len(handler.records) == 2 and handler.records[-1].completed == 1
@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+
+from pytrthree import TRTHIterator
+from pytrthree.watcher import LandingZoneWatcher, request_id
+
+from .conftest import make_rows, write_csv
+
+
+def test_request_id():
+    assert request_id('/ftp/user@domain.com-name-N123456789-part001.csv.gz') == 'user@domain.com-name-N123456789'
+    assert request_id('user@domain.com-N123456789-report.csv') == 'user@domain.com-N123456789'
+    with pytest.raises(ValueError):
+        request_id('notes.txt')
+
+
+def test_watcher(tmpdir, mock_api, mock_server):
+    rid = mock_server.submit_ftp_request(dict(friendlyName='watch'))['requestID']
+    rows = make_rows()
+    ingested = {}
+
+    def ingest(path):
+        ingested[os.path.basename(path)] = sum(len(df) for _, df in TRTHIterator(path))
+
+    watcher = LandingZoneWatcher(str(tmpdir), ingest, settle=0.2, api=mock_api, cancel=True,
+                                 journal=str(tmpdir.join('.journal')), use_inotify=False)
+    part0 = str(tmpdir.join(f'{rid}-part000.csv.gz'))
+    write_csv(part0, rows[:1000])
+    write_csv(str(tmpdir.join(f'{rid}-part001.csv.gz.part')), rows[1000:])  # In-flight upload
+    tmpdir.join(f'{rid}-confirmation.csv').write('confirmation')
+    watcher.poll()
+    assert not ingested
+    time.sleep(0.3)
+    watcher.poll()
+    assert ingested == {os.path.basename(part0): 1000}
+
+    os.rename(str(tmpdir.join(f'{rid}-part001.csv.gz.part')), str(tmpdir.join(f'{rid}-part001.csv.gz')))
+    tmpdir.join(f'{rid}-report.csv').write('report')
+    time.sleep(0.3)
+    watcher.poll()
+    assert sum(ingested.values()) == 4000 and len(ingested) == 2
+    assert watcher.requests['N' + rid.split('-N')[-1]].delivered
+    assert mock_api.get_request_result(requestID=rid)['result']['status'] == 'Aborted'
+
+    # Ingested parts are skipped after a restart
+    ingested.clear()
+    watcher = LandingZoneWatcher(str(tmpdir), ingest, settle=0.2, poll_interval=0.1, journal=str(tmpdir.join('.journal')),
+                                 use_inotify=False)
+    watcher.run(until_delivered=True)
+    assert not ingested
+
+
+def test_removed_during_scan(tmpdir, monkeypatch):
+    paths = [str(tmpdir.join(f'user-a-N123456789-part00{i}.csv.gz')) for i in range(2)]
+    for path in paths:
+        write_csv(path, make_rows(n=10))
+    entries = list(os.scandir(str(tmpdir)))
+    os.remove(paths[0])
+    monkeypatch.setattr(os, 'scandir', lambda directory: iter(entries))
+    watcher = LandingZoneWatcher(str(tmpdir), lambda path: None, settle=0, use_inotify=False)
+    assert watcher.scan() == [paths[1]]
+
+
+def test_ingest_retry(tmpdir, mock_api, mock_server):
+    rid = mock_server.submit_ftp_request(dict(friendlyName='retry'))['requestID']
+    calls = []
+
+    def ingest(path):
+        calls.append(path)
+        if len(calls) == 1:
+            raise IOError('Database unavailable')
+
+    watcher = LandingZoneWatcher(str(tmpdir), ingest, settle=0, api=mock_api, cancel=True,
+                                 use_inotify=False, retry_delay=0.2)
+    write_csv(str(tmpdir.join(f'{rid}-part000.csv.gz')), make_rows(n=10))
+    tmpdir.join(f'{rid}-report.csv').write('report')
+    watcher.poll()
+    request = watcher.requests['N' + rid.split('-N')[-1]]
+    assert len(calls) == 1 and not request.delivered  # Not canceled
+    watcher.poll()
+    assert len(calls) == 1  # Backing off
+    time.sleep(0.3)
+    watcher.poll()
+    assert len(calls) == 2 and request.delivered
+    assert mock_api.get_request_result(requestID=rid)['result']['status'] == 'Aborted'
+
+
+def test_ingest_failed(tmpdir):
+    def ingest(path):
+        raise IOError('Corrupt file')
+
+    watcher = LandingZoneWatcher(str(tmpdir), ingest, settle=0, poll_interval=0.01, use_inotify=False,
+                                 max_attempts=2, retry_delay=0.01)
+    write_csv(str(tmpdir.join('user-a-N123456789-part000.csv.gz')), make_rows(n=10))
+    tmpdir.join('user-a-N123456789-report.csv').write('report')
+    with pytest.raises(RuntimeError):
+        watcher.run(until_delivered=True)
+    request = watcher.requests['N123456789']
+    assert request.parts[request.failed[0]]['attempts'] == 2 and not request.delivered
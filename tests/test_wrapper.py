@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+from zeep.exceptions import Fault
+
+
+def test_options(mock_api):
+    assert mock_api.raise_exception
+    with mock_api.override(raise_exception=False):
+        assert not mock_api.raise_exception
+        assert mock_api.get_request_result('unknown') is None
+    assert mock_api.raise_exception
+    assert mock_api.get_request_result('unknown', _options=dict(raise_exception=False)) is None
+    with pytest.raises(Fault):
+        mock_api.get_request_result('unknown')
+    with pytest.raises(ValueError):
+        with mock_api.override(foo=True):
+            pass
+
+
+def test_options_are_thread_local(mock_api):
+    seen = {}
+    barrier = threading.Barrier(2)
+
+    def worker(value):
+        with mock_api.override(target_cls=value):
+            barrier.wait()
+            seen[value] = mock_api.target_cls
+
+    threads = [threading.Thread(target=worker, args=(value,)) for value in (None, dict)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == {None: None, dict: dict}
+    assert mock_api.target_cls is dict
+
+
+def test_map(mock_api):
+    chains = ['0#.N225', '0#.TOPX', '0#.JSDA', '0#.MOTHERS']
+    results = mock_api.map('expand_chain', chains, max_workers=4)
+    assert [r[0] for r in results] == [c.split('#')[-1] for c in chains]
+
+    params = [dict(requestID='unknown'), ('unknown',)]
+    results = mock_api.map(mock_api.get_request_result, params, return_exceptions=True)
+    assert all(isinstance(r, Fault) for r in results)
+    assert mock_api.map('get_request_result', params, raise_exception=False) == [None, None]
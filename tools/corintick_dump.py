@@ -3,30 +3,97 @@ import argparse
 import glob
 import os
 
-from pytrthree import TRTHIterator
+from pytrthree import TRTH, TRTHIterator
+from pytrthree.coordinator import WorkQueue, Worker
+from pytrthree.watcher import LandingZoneWatcher
 from corintick import Corintick, ValidationError
 
 
-def main(args):
-    db = Corintick(args.config)
-    files = glob.glob(os.path.expanduser(args.files))
-    for ric, df in TRTHIterator(files):
+def ingest(db, files, args, lost=None) -> int:
+    """
+    Inserts `files` into Corintick and returns the number of rows inserted.
+    Stops early once `lost` (the lease event of a queue worker) is set.
+    """
+    iterator = TRTHIterator(files)
+    if args.bars:
+        size = args.bars if args.by == 'time' else float(args.bars)
+        iterator = iterator.bars(size, by=args.by)
+    rows = 0
+    for ric, df in iterator:
+        if lost is not None and lost.is_set():
+            db.logger.warning(f'Lease of {files} lost: stopping after {rows} rows')
+            break
         cols = args.columns if args.columns else df.columns
         try:
             db.write(ric, df[cols], collection=args.collection)
+            rows += len(df)
         except ValidationError as e:
             db.logger.error(e)
+    return rows
+
+
+def main(args):
+    files = glob.glob(os.path.expanduser(args.files))
+    if args.queue:
+        queue = WorkQueue(args.queue, lease_time=args.lease)
+        if args.status:
+            print(queue.progress())
+            print(queue.stats().to_string())
+            return
+        queue.add(files)
+    db = Corintick(args.config)
+    if args.watch:
+        api = TRTH(config=args.trth_config) if args.cancel else None
+        watcher = LandingZoneWatcher(args.watch, lambda path: ingest(db, [path], args), settle=args.settle,
+                                     api=api, cancel=args.cancel, journal=args.journal)
+        try:
+            watcher.run()
+        finally:
+            watcher.close()
+    elif args.queue:
+        worker = Worker(queue, args.worker)
+        worker.run(lambda unit, lost: ingest(db, [unit.path], args, lost))
+        db.logger.info(f'{worker.name} finished: {queue.progress()}')
+    else:
+        ingest(db, files, args)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Parse TRTH files and insert into Corintick.')
     parser.add_argument('--config', type=argparse.FileType('r'), required=True,
                         help='Corintick configuration (YAML file)')
-    parser.add_argument('--files', type=str, default='*', required=True,
+    parser.add_argument('--files', type=str, default='*',
                         help='Glob of files to insert')
     parser.add_argument('--columns', nargs='*', type=str,
                         help='Columns to be inserted (optional)')
+    parser.add_argument('--bars', type=str, default=None,
+                        help='Aggregate ticks into bars of this size before inserting (optional). '
+                             'Pandas frequency string for time bars (e.g. "1min"), '
+                             'number of shares/ticks for volume/tick bars.')
+    parser.add_argument('--by', type=str, default='time', choices=['time', 'volume', 'tick'],
+                        help='Bar type. Default: time.')
     parser.add_argument('--collection', type=str, default=None,
                         help='Collection to insert to (optional)')
+    parser.add_argument('--queue', type=str, default=None,
+                        help='Shared SQLite work queue (optional). Files matching --files are registered '
+                             'and processed part by part, so several hosts can ingest the same directory.')
+    parser.add_argument('--worker', type=str, default=None,
+                        help='Unique worker name. Default: <hostname>-<pid>.')
+    parser.add_argument('--lease', type=float, default=300,
+                        help='Seconds before the part of an unresponsive worker is reassigned. Default: 300.')
+    parser.add_argument('--status', action='store_true',
+                        help='Print the queue progress and per-worker throughput and exit.')
+    parser.add_argument('--watch', type=str, default=None,
+                        help='Landing directory to watch (optional). Parts are inserted as soon as they are complete.')
+    parser.add_argument('--settle', type=float, default=30,
+                        help='Seconds without size changes before a part is considered complete. Default: 30.')
+    parser.add_argument('--journal', type=str, default=None,
+                        help='File recording inserted parts, which are skipped after a restart (optional).')
+    parser.add_argument('--cancel', action='store_true',
+                        help='Cancel requests after all their parts have arrived (requires --trth-config).')
+    parser.add_argument('--trth-config', type=argparse.FileType('r'), default=None,
+                        help='TRTH API configuration (YAML file)')
     args = parser.parse_args()
+    if args.cancel and not args.trth_config:
+        parser.error('--cancel requires --trth-config')
     main(args)
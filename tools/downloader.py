@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import asyncio
 import argparse
+import collections
 import io
 import re
 
@@ -8,7 +9,7 @@ import aiohttp
 import pandas as pd
 import requests
 import pytrthree
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pytrthree.watcher import request_id as request_id_of
 
 TRTH_HTTP_LIST = 'http://tickhistory.thomsonreuters.com/HttpPull/List'
 TRTH_HTTP_DWLD = 'https://tickhistory.thomsonreuters.com/HttpPull/Download'
@@ -24,11 +25,11 @@ class Downloader:
         self.results = self.list_results()
         z = zip(self.results['name'].apply(self.parse_fname), self.results['size'])
         self.progress = {fname: dict(downloaded=0, total=total, state=None) for fname, total in z}
+        self.overall = pytrthree.utils.Progress(self.api.logger, 'Download')
+        self.states = collections.Counter(progress['state'] for progress in self.progress.values())
         self.requests = {group: data['name'].apply(self.parse_fname).tolist()
                          for group, data in self.results.groupby('id')}
         self.loop = asyncio.get_event_loop()
-        self.scheduler = AsyncIOScheduler()
-        self.scheduler.add_job(self.print_progress, 'interval', seconds=5)
         self.semaphore = asyncio.Semaphore(args.max)
 
     def start(self):
@@ -37,8 +38,8 @@ class Downloader:
         self.api.logger.info(f'Downloading {len(files)} files:\n{file_list}')
         if not self.args.dryrun:
             fut = asyncio.gather(*[self.download(f) for f in files])
-            self.scheduler.start()
             self.loop.run_until_complete(fut)
+            self.overall.close()
 
     @staticmethod
     def parse_fname(x):
@@ -63,16 +64,17 @@ class Downloader:
     async def save_stream(self, resp, file):
         filename = self.parse_fname(file)
         self.api.logger.info(f'Downloading {filename}')
-        self.progress[filename]['state'] = 'D'
+        self.set_state(filename, 'D')
         with open(filename, 'wb') as f:
             while True:
                 chunk = await resp.content.read(256*1024)
                 self.progress[filename]['downloaded'] += len(chunk)
+                self.overall.update(bytes=len(chunk))
                 if not chunk:
                     break
                 f.write(chunk)
         self.progress[filename]['downloaded'] = self.progress[filename]['total']
-        self.progress[filename]['state'] = 'C'
+        self.set_state(filename, 'C')
         self.api.logger.info(f'Finished downloading {filename}')
         if self.args.cancel:
             self.maybe_cancel_request(filename)
@@ -81,23 +83,18 @@ class Downloader:
         rid = pytrthree.utils.parse_rid_type(filename)[0]
         completed = [self.progress[fname]['state'] == 'C' for fname in self.requests[rid]]
         report = [pytrthree.utils.parse_rid_type(fname)[1] == 'report' for fname in self.requests[rid]]
-        # print(completed)
-        # print(report)
         if all(completed) and any(report):
-            self.api.logger.info(f'Canceling {rid}')
-            # self.api.cancel_request()
-            # api.cancel
+            request_id = request_id_of(self.results.loc[self.results['id'] == rid, 'name'].iloc[0])
+            self.api.logger.info(f'Canceling {request_id}')
+            self.api.cancel_request(requestID=request_id)
 
-    def print_progress(self):
-        completed = 0
-        for fname, progress in self.progress.items():
-            if progress['state'] == 'D':
-                pct = progress['downloaded'] / progress['total']
-                self.api.logger.info(f'{fname}: {pct:.1%}')
-            elif progress['state'] == 'C':
-                completed +=1
-        if completed:
-            self.api.logger.info(f'Completed: {completed}')
+    def set_state(self, filename, state):
+        """Updates the state of a file along with the downloading/completed counters"""
+        previous = self.progress[filename]['state']
+        self.progress[filename]['state'] = state
+        self.states[previous] -= 1
+        self.states[state] += 1
+        self.overall.update(downloading=self.states['D'], completed=self.states['C'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+import argparse
+import glob
+import os
+
+from pytrthree import TRTHIterator
+from pytrthree.gzindex import RICIndex
+
+
+def main(args):
+    files = TRTHIterator._validate_input(glob.glob(os.path.expanduser(args.files)))
+    for file in files:
+        if not args.force and RICIndex.load(file) is not None:
+            print(f'Skipping {file} (already indexed)')
+            continue
+        index = RICIndex.build(file, spacing=int(args.spacing * 2 ** 20))
+        print(f'Indexed {file}: {len(index.rics)} RICs')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build sidecar per-RIC seek indexes for TRTH .csv.gz files.')
+    parser.add_argument('--files', type=str, required=True,
+                        help='Glob of files to index')
+    parser.add_argument('--spacing', type=float, default=4,
+                        help='Distance between gzip access points in MiB of uncompressed data. Default: 4.')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild existing (up-to-date) indexes.')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+import argparse
+import concurrent.futures
+import statistics
+import time
+
+import yaml
+from pytrthree import TRTH
+from pytrthree.mockserver import MockTRTH, make_config
+
+
+def call(api, function, kwargs):
+    start = time.perf_counter()
+    try:
+        getattr(api, function)(**kwargs)
+        ok = True
+    except Exception as e:
+        api.logger.debug(e)
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run(api, function, kwargs, calls, threads):
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda _: call(api, function, kwargs), range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency * 1000 for latency, _ in results]
+    errors = sum(not ok for _, ok in results)
+    return dict(function=function, calls=calls, threads=threads, errors=errors,
+                elapsed=round(elapsed, 3), calls_per_sec=round(calls / elapsed, 1),
+                mean_ms=round(statistics.mean(latencies), 2),
+                p50_ms=round(percentile(latencies, 50), 2),
+                p90_ms=round(percentile(latencies, 90), 2),
+                p99_ms=round(percentile(latencies, 99), 2),
+                max_ms=round(max(latencies), 2))
+
+
+def main(args):
+    server = None
+    if args.wsdl:
+        latency = args.latency if len(args.latency) > 1 else args.latency[0]
+        server = MockTRTH(args.wsdl, latency=latency, fault_rate=args.fault_rate,
+                          rate_limit=args.rate_limit, seed=0).start()
+        config = make_config(server)
+    else:
+        config = args.config
+    try:
+        api = TRTH(config=config)
+        api.options['raise_exception'] = True
+        kwargs = yaml.safe_load(args.kwargs) or {}
+        for threads in args.threads:
+            result = run(api, args.function, kwargs, args.calls, threads)
+            api.logger.info(' | '.join(f'{k}: {v}' for k, v in result.items()))
+        if server is not None:
+            api.logger.info(f'Server stats: {server.stats()}')
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark TRTH client throughput and latency.')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--config', action='store', type=argparse.FileType('r'),
+                        help='TRTH API configuration (YAML file). Benchmarks the real service.')
+    target.add_argument('--wsdl', action='store', type=str,
+                        help='TRTH WSDL (path or URL). Benchmarks against a local mock server.')
+    parser.add_argument('--function', action='store', type=str, default='get_status',
+                        help='TRTH method to call. Default: get_status.')
+    parser.add_argument('--kwargs', action='store', type=str, default='{}',
+                        help='Method keyword arguments (YAML/JSON string). Default: {}.')
+    parser.add_argument('--calls', action='store', type=int, default=1000,
+                        help='Number of calls per run. Default: 1000.')
+    parser.add_argument('--threads', action='store', type=int, nargs='+', default=[1, 4, 16],
+                        help='Thread counts to benchmark (one run each). Default: 1 4 16.')
+    parser.add_argument('--latency', action='store', type=float, nargs='+', default=[0],
+                        help='Mock server latency in seconds (or low/high bounds). Default: 0.')
+    parser.add_argument('--fault-rate', action='store', type=float, default=0,
+                        help='Mock server fault probability. Default: 0.')
+    parser.add_argument('--rate-limit', action='store', type=float, default=None,
+                        help='Mock server throttling threshold in calls/sec. Default: None.')
+    args = parser.parse_args()
+    main(args)
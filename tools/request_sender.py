@@ -5,20 +5,24 @@ import datetime
 import pandas as pd
 import yaml
 from pytrthree import TRTH
-from pytrthree.utils import retry
+from pytrthree.retry import RetryPolicy
+from pytrthree.universe import DayCache, expand_chains
 
 
 def make_request(daterange, criteria):
-    request = api.factory.LargeRequestSpec(**template)
     short_dates = sorted([x.replace('-', '') for x in daterange.values()])
-    search_result = api.search_rics(daterange, criteria['ric'], refData=False)
-    ric_list = [{'code': i['code']} for i in search_result]
-    request['friendlyName'] = '{}-{}_{}'.format(name, *short_dates)
-    request['instrumentList']['instrument'] = ric_list
-    request['dateRange'] = daterange
+    ric_list = []
+    if 'ric' in criteria:
+        search_result = api.search_rics(daterange, criteria['ric'], refData=False)
+        ric_list += [i['code'] for i in search_result]
+    if 'chain' in criteria:
+        chains = expand_chains(api, criteria['chain'], daterange, cache=cache)
+        ric_list += [ric for members in chains.values() for ric in members]
+    overrides = dict(friendlyName='{}-{}_{}'.format(name, *short_dates),
+                     instruments=ric_list, dateRange=daterange)
     if 'fields' in criteria:
-        request['messageTypeList']['messageType'][0]['fieldList']['string'] = criteria['fields']
-    return request
+        overrides['fields'] = criteria['fields']
+    return api.templates.clone(args.template, 'LargeRequestSpec', **overrides)
 
 
 def parse_daterange(s):
@@ -29,8 +33,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Tool to send a series of requests to TRTH.')
     parser.add_argument('--config', action='store', type=argparse.FileType('r'), required=True,
                         help='TRTH API configuration (YAML file)')
-    parser.add_argument('--template', action='store', type=argparse.FileType('r'), required=True,
-                        help='Base template for the requests (YAML file)')
+    parser.add_argument('--template', action='store', type=str, required=True,
+                        help='Base template for the requests (YAML file path or name of a bundled template, e.g. LargeRequestSpec)')
     parser.add_argument('--criteria', action='store', type=argparse.FileType('r'), required=True,
                         help='Criteria for searching RICs and modifying queried fields (YAML file)')
     parser.add_argument('--start', action='store', type=str, required=True,
@@ -43,14 +47,17 @@ if __name__ == '__main__':
 
     api = TRTH(config=args.config)
     api.options['raise_exception'] = True
+    if api.retry is None:
+        api.options['retry'] = RetryPolicy(max_attempts=20, base=30, cap=600, deadline=None)
+    cache = DayCache(api.config.get('cache'))
     criteria = yaml.load(args.criteria)
-    template = yaml.load(args.template)
 
     dates = pd.date_range(args.start, args.end).to_series()
     dateranges = [parse_daterange(i) for _, i in dates.groupby(pd.TimeGrouper(args.group))]
     for daterange in dateranges:
         for name, crit in criteria.items():
             request = make_request(daterange, crit)
-            rid = retry(api.submit_ftp_request, request, sleep=30, exp_base=2)
+            rid = api.submit_ftp_request(request)
             api.logger.info(rid['requestID'])
+    cache.close()
     api.logger.info('All requests sent!')
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import argparse
+import glob
+import os
+
+from pytrthree import TRTHIterator
+from pytrthree.transcode import ZstdPart
+
+
+def main(args):
+    files = TRTHIterator._validate_input(glob.glob(os.path.expanduser(args.files)))
+    for file in files:
+        if not file.endswith('.gz'):
+            continue
+        if not args.force and ZstdPart.get(file) is not None:
+            print(f'Skipping {file} (already transcoded)')
+            continue
+        part = ZstdPart.transcode(file, level=args.level, frame_size=int(args.frame_size * 2 ** 20),
+                                  threads=args.threads)
+        ratio = os.path.getsize(file) / os.path.getsize(part.path)
+        print(f'Transcoded {file}: {part.rows} rows, {len(part.frames)} frames, {ratio:.2f}x smaller')
+        if args.remove_source:
+            os.remove(file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Transcode TRTH .csv.gz files into seekable multi-frame .csv.zst files.')
+    parser.add_argument('--files', type=str, required=True,
+                        help='Glob of files to transcode')
+    parser.add_argument('--level', type=int, default=9,
+                        help='zstd compression level. Default: 9.')
+    parser.add_argument('--frame-size', type=float, default=4,
+                        help='Uncompressed size of each zstd frame in MiB. Default: 4.')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Number of compression threads. Default: number of CPUs.')
+    parser.add_argument('--force', action='store_true',
+                        help='Transcode again parts with an up-to-date .csv.zst file.')
+    parser.add_argument('--remove-source', action='store_true',
+                        help='Remove .csv.gz files after they have been transcoded and verified.')
+    args = parser.parse_args()
+    main(args)